@@ -1,9 +1,20 @@
+from __future__ import annotations
+
 import pyomo.environ as po
+from pyomo.core.expr.numeric_expr import LinearExpression
 import numpy as np
 
 import constraint
 import helpers
 
+# Random number generator shared by all probabilistic bid acceptances
+rng = np.random.default_rng()
+
+def _add_params(block: po.Block, specs: list[tuple]) -> None:
+    """Declare all Params of a block in one pass from (name, index, values, domain) specifications"""
+    for name, index, values, domain in specs:
+        block.add_component(name, po.Param(index, initialize=values, within=domain))
+
 class FCR:
     instantiate_counter = 0
 
@@ -25,7 +36,7 @@ class FCR:
         self.pos_freq_dev_max = pos_freq_dev_max  # 15-min wise maximum of positive frequency deviations
         self.neg_freq_dev_max = neg_freq_dev_max  # 15-min wise maximum of negative frequency deviations
         self.timesteps = self.model.timesteps  # Timesteps of the simulation
-        self.duration = 16
+        self.duration = 16 // self.params['agg_factor']  # Timesteps of one 4h slot
 
         # Counter for naming the blocks uniquely
         FCR.instantiate_counter += 1
@@ -42,27 +53,29 @@ class FCR:
         self.sum_freq_dev = self.pos_freq_dev + self.neg_freq_dev
 
         # When frequency above 50 Hz, negative FCR will be provided
-        self.source_request = self.sum_freq_dev.copy()
-        self.source_request[self.source_request > 0] = 0
         # But still the request profile has to be positive
-        self.source_request *= -1
+        self.source_request = np.clip(-self.sum_freq_dev, 0.0, None)
 
         # When frequency below 50 Hz, positive FCR will be provided
-        self.sink_request = self.sum_freq_dev.copy()
-        self.sink_request[self.sink_request < 0] = 0
+        self.sink_request = np.clip(self.sum_freq_dev, 0.0, None)
+
+        # 4h slots sharing one volume bid and activation choice
+        self.slots = range(len(self.timesteps) // self.duration)
 
         # Capacity revenue prices
         # Get capacity revenue price profile from a .csv file in the directory
-        self.capacity_prices = helpers.get_prices(filename=self.capacity_price_file, column_name='Data')
-        self.capacity_prices = self.capacity_prices.repeat(16)
-        self.capacity_prices = self.capacity_prices[:len(self.timesteps)]
+        self.capacity_prices = helpers.get_capacity_prices(
+            filename=self.capacity_price_file,
+            column_name='Data',
+            slots=len(self.slots)
+        )
 
         # Probability of volume being accepted
         # Create six probabilities for every 4h slot
         self.probability = self.params['fcr_accept_prob'] / 100
-        self.stoch_indices = (np.random.rand(self.params['days'] * 6) < self.probability).astype(int)
-        # Repeat the profile to match the 96 interval length
-        self.stoch_row = self.stoch_indices.repeat(16)
+        self.stoch_indices = (rng.random(self.params['days'] * 6) < self.probability).astype(np.int8)
+        # Repeat the profile to match the interval length
+        self.stoch_row = self.stoch_indices.repeat(self.duration)
 
 
     def _init_variables(self):
@@ -86,99 +99,109 @@ class FCR:
             within=po.NonNegativeReals
         )
 
-        # Optimizers decision whether to activate FCR
-        self.block.activation_choice = po.Var(self.timesteps, within=po.Binary)
-
-        # Copy of the source power request to pyomo data format
-        self.block.power_request_source = po.Param(
-            self.timesteps,
-            initialize=self.source_request / 0.2, # linear activation until 0.2 Hz above 50 Hz
-            within=po.NonNegativeReals
-        )
-
-        # Copy of the sink power request to pyomo data format
-        self.block.power_request_sink = po.Param(
-            self.timesteps,
-            initialize=self.sink_request / 0.2, # linear activation until 0.2 Hz below 50 Hz
-            within=po.NonNegativeReals
-        )
-
-        # Copy the peak capacity revenue to pyomo data format
-        self.block.possible_capacity_revenue = po.Param(
-            self.timesteps,
-            initialize=self.capacity_prices,
-            within=po.NonNegativeReals
-        )
+        # Optimizers decision whether to activate FCR in each 4h slot
+        self.block.activation_choice = po.Var(self.slots, within=po.Binary)
+
+        # Copy the inputs to pyomo data format
+        _add_params(self.block, [
+            # Source power request, linear activation until 0.2 Hz above 50 Hz
+            ('power_request_source', self.timesteps, (self.source_request / 0.2).tolist(), po.Reals),
+            # Sink power request, linear activation until 0.2 Hz below 50 Hz
+            ('power_request_sink', self.timesteps, (self.sink_request / 0.2).tolist(), po.Reals),
+            # 4h capacity prices
+            ('possible_capacity_revenue', self.slots, self.capacity_prices.tolist(), po.Reals),
+            # Probability of volume bid acceptance in each 4h slot
+            ('bid_accept', self.slots, self.stoch_indices.tolist(), po.Integers),
+        ])
 
         # Real capacity revenue with respect to optimizers decisions
         self.block.capacity_revenue = po.Var(self.timesteps, within=po.NonNegativeReals)
 
-        # Volume to be bid [kW]
-        self.block.volume = po.Var(self.timesteps, within=po.NonNegativeReals)
+        # Volume to be bid in each 4h slot [kW]
+        self.block.volume = po.Var(self.slots, bounds=(0, self.params['fcr_max_vol']), within=po.NonNegativeReals)
 
-        # Probability of volume bid acceptance
-        self.block.bid_accept = po.Param(self.timesteps, initialize=self.stoch_row, within=po.Binary)
+        # Volume bid if activated, the product of activation choice and volume [kW]
+        if self.params['fcr_levels']:
+            # Discrete levels already force the volume bid to zero without activation
+            self.activated_volume = self.block.volume
+        else:
+            self.block.activated_volume = po.Var(self.slots, within=po.NonNegativeReals)
+            self.activated_volume = self.block.activated_volume
 
 
     def _add_constraints(self):
         """Add constraints to define the custom behavior"""
 
-        # Ensure volume bid of FCR can only take discrete levels
+        # Ensure volume bid of FCR can only take discrete levels, none of them without activation
         if self.params['fcr_levels']:
             constraint.DiscreteLevels(
                 model=self.model,
                 params=self.params,
                 flow=self.block.volume,
                 levels=list(range(
-                    self.params['fcr_min_vol'], self.params['fcr_max_vol'] + 1, self.params['fcr_step_size'])))
-
-        def reach1_rule(block: po.Block, t: int):
-            """Ensure the provision of control reserve in equally distant 4h slots"""
-            if t > 0 and t % self.duration != 0:
-                return block.volume[t] == block.volume[t - 1]
-            else:
-                return po.Constraint.Skip
-
-        self.block.reach1_constraint = po.Constraint(self.timesteps, rule=reach1_rule)
-
-        def reach2_rule(block: po.Block, t: int):
-            """Ensure the provision of control reserve in equally distant 4h slots"""
-            if t > 0 and t % self.duration != 0:
-                return block.activation_choice[t] == block.activation_choice[t - 1]
-            else:
-                return po.Constraint.Skip
+                    self.params['fcr_min_vol'], self.params['fcr_max_vol'] + 1, self.params['fcr_step_size'])),
+                choice=self.block.activation_choice,
+                index=self.slots)
+        # Otherwise linearize the product of activation choice and volume
+        else:
+            constraint.BinaryProduct(
+                model=self.model,
+                params=self.params,
+                choice=self.block.activation_choice,
+                flow=self.block.volume,
+                product=self.block.activated_volume,
+                big_M=self.params['fcr_max_vol'],
+                index=self.slots)
 
-        self.block.reach2_constraint = po.Constraint(self.timesteps, rule=reach2_rule)
+        # Coefficients of the activated volume, precomputed once instead of two Param lookups per rule call
+        source_coefs = (-self.source_request / 0.2 * self.stoch_row).tolist()
+        sink_coefs = (-self.sink_request / 0.2 * self.stoch_row).tolist()
+        revenue_coefs = (-self.capacity_prices * self.stoch_indices).tolist()
+        duration = self.duration
 
         def multiplication_source_rule(block: po.Block, t: po.Set):
             """Set the flow to match the source power request when optimizer thinks FCR is needed"""
-            return block.flow_source[t] == block.power_request_source[t] * block.activation_choice[t] * block.volume[t] * block.bid_accept[t]
+            return LinearExpression(
+                constant=0,
+                linear_coefs=[1, source_coefs[t]],
+                linear_vars=[block.flow_source[t], self.activated_volume[t // duration]]
+            ) == 0
 
         self.block.multiplication_source_constraint = po.Constraint(self.timesteps, rule=multiplication_source_rule)
 
         def multiplication_sink_rule(block: po.Block, t: po.Set):
             """Set the flow to match the sink power request when optimizer thinks FCR is needed"""
-            return block.flow_sink[t] == block.power_request_sink[t] * block.activation_choice[t] * block.volume[t] * block.bid_accept[t]
+            return LinearExpression(
+                constant=0,
+                linear_coefs=[1, sink_coefs[t]],
+                linear_vars=[block.flow_sink[t], self.activated_volume[t // duration]]
+            ) == 0
 
         self.block.multiplication_sink_constraint = po.Constraint(self.timesteps, rule=multiplication_sink_rule)
 
         def capacity_revenue_rule(block: po.Block, t: po.Set):
             """Compute the real capacity revenue with respect to the optimizers decisions"""
-            return block.capacity_revenue[t] == block.activation_choice[t] * block.possible_capacity_revenue[t] * block.volume[t] * block.bid_accept[t]
+            return LinearExpression(
+                constant=0,
+                linear_coefs=[1, revenue_coefs[t // duration]],
+                linear_vars=[block.capacity_revenue[t], self.activated_volume[t // duration]]
+            ) == 0
 
         self.block.capacity_revenue_constraint = po.Constraint(self.timesteps, rule=capacity_revenue_rule)
 
-    def get_results(self, t: int, name: str) -> None:
-        """Print out all variables to the terminal"""
-        print(f"\n{f'{name} Capacity Price:':<{self.params['val_pos']}} {self.capacity_prices[t]:.2f} ct/kW")
-        print(f"{f'{name} Flow:':<{self.params['val_pos']}} {self.block.flow_source[t].value - self.block.flow_sink[t].value:.2f} kW")
-        print(f"{f'{name} Activation Choice:':<{self.params['val_pos']}} {self.block.activation_choice[t].value:.0f}")
-        print(f"{f'{name} 4h-Bid-accept profile (probabilistic):':<{self.params['val_pos']}} {self.stoch_indices}")
-        print(f"{f'{name} Current Bid accepted (probabilistic):':<{self.params['val_pos']}} {self.block.bid_accept[t]:.0f}")
-        print(f"{f'{name} 15-min average Frequency Deviation:':<{self.params['val_pos']}} {self.sum_freq_dev[t]:.4f} Hz")
-        print(f"{f'{name} absolute Power Request:':<{self.params['val_pos']}} {(self.block.power_request_source[t] - self.block.power_request_sink[t]) * self.params['fcr_max_vol']:.2f} kW")
-        print(f"{f'{name} relative Power Request:':<{self.params['val_pos']}} {(self.block.power_request_source[t] - self.block.power_request_sink[t]) * 100:.2f} %")
-        print(f"{f'{name} Volume Bid:':<{self.params['val_pos']}} {self.block.volume[t].value:.2f} kW")
+    def get_results(self, t: int, name: str) -> list[str]:
+        """Return the report lines of all variables"""
+        return [
+            f"\n{f'{name} Capacity Price:':<{self.params['val_pos']}} {self.capacity_prices[t // self.duration]:.2f} ct/kW",
+            f"{f'{name} Flow:':<{self.params['val_pos']}} {self.block.flow_source[t].value - self.block.flow_sink[t].value:.2f} kW",
+            f"{f'{name} Activation Choice:':<{self.params['val_pos']}} {self.block.activation_choice[t // self.duration].value:.0f}",
+            f"{f'{name} 4h-Bid-accept profile (probabilistic):':<{self.params['val_pos']}} {self.stoch_indices}",
+            f"{f'{name} Current Bid accepted (probabilistic):':<{self.params['val_pos']}} {self.block.bid_accept[t // self.duration]:.0f}",
+            f"{f'{name} 15-min average Frequency Deviation:':<{self.params['val_pos']}} {self.sum_freq_dev[t]:.4f} Hz",
+            f"{f'{name} absolute Power Request:':<{self.params['val_pos']}} {(self.block.power_request_source[t] - self.block.power_request_sink[t]) * self.params['fcr_max_vol']:.2f} kW",
+            f"{f'{name} relative Power Request:':<{self.params['val_pos']}} {(self.block.power_request_source[t] - self.block.power_request_sink[t]) * 100:.2f} %",
+            f"{f'{name} Volume Bid:':<{self.params['val_pos']}} {self.block.volume[t // self.duration].value:.2f} kW",
+        ]
 
 
 class aFRR:
@@ -206,7 +229,7 @@ class aFRR:
         self.freq_extreme = freq_extreme # Most Extreme frequency deviation in the frequency profile for every 15-min
         self.request_profile = request_profile # System request of aFRR
         self.timesteps = self.model.timesteps  # Timesteps of the simulation
-        self.duration = 16
+        self.duration = 16 // self.params['agg_factor']  # Timesteps of one 4h slot
 
         # Counter for naming the blocks uniquely
         aFRR.instantiate_counter += 1
@@ -222,35 +245,43 @@ class aFRR:
         # Probability of the volume bid being accepted
         # Create six probabilities for every 4h slot
         self.probability = self.params['afrr_accept_prob']/100
-        self.stoch_indices = (np.random.rand(self.params['days']*6) < self.probability).astype(int)
-        # Repeat the profile to match the 96 interval length
-        self.stoch_row = self.stoch_indices.repeat(16)
+        self.stoch_indices = (rng.random(self.params['days'] * 6) < self.probability).astype(np.int8)
+        # Repeat the profile to match the interval length
+        self.stoch_row = self.stoch_indices.repeat(self.duration)
+
+        # 4h slots sharing one activation choice
+        self.slots = range(len(self.timesteps) // self.duration)
 
-        # Adjust the length to match the simulation duration
-        self.request_profile = self.request_profile[:len(self.timesteps)]
+        # Adjust the length to match the time resolution and the simulation duration, any request counts
+        self.request_profile = helpers.aggregate(
+            self.request_profile, self.params['agg_factor'], reducer=np.max)[:len(self.timesteps)]
 
         # CAPACITY REVENUE PRICES
         # Get capacity revenue price profile from a .csv file in the directory
-        self.capacity_prices = helpers.get_prices(filename=self.capacity_price_file, column_name='Data')
-        # Adjust the length to match the simulation duration
-        self.capacity_prices = self.capacity_prices.repeat(16)
-        self.capacity_prices = self.capacity_prices[:len(self.timesteps)]
+        self.capacity_prices = helpers.get_capacity_prices(
+            filename=self.capacity_price_file,
+            column_name='Data',
+            slots=len(self.slots)
+        )
 
         # # Only max in every 4h slot is relevant for capacity revenue price
         # self.poss_revenue = self.capacity_prices * self.request_profile/max(self.request_profile)*self.freq_profile/0.2
 
         # Binary activation signal of the request
-        self.request_profile[self.request_profile>0] = 1
-        self.request_profile[self.request_profile<0] = 0
+        self.request_profile = (self.request_profile > 0).astype(np.int8)
 
         # ENERGY REVENUE PRICES
         # Get energy revenue price profile from a .csv file in the directory
         if self.params['afrr_market_clearing']:
-            self.energy_prices = helpers.market_clearing(request_filename=self.request_file, bid_filename=self.bid_file)
+            self.energy_prices = helpers.market_clearing(
+                request_filename=self.request_file,
+                bid_filename=self.bid_file,
+                plot=self.params['plot_inputs']
+            )
         else:
             self.energy_prices = helpers.get_prices(filename=self.price_file, column_name='Data')
-        # Adjust the length to match the simulation duration
-        self.energy_prices = self.energy_prices[:len(self.timesteps)]
+        # Adjust the length to match the time resolution and the simulation duration
+        self.energy_prices = helpers.aggregate(self.energy_prices, self.params['agg_factor'])[:len(self.timesteps)]
 
 
     def _init_variables(self):
@@ -268,76 +299,95 @@ class aFRR:
             within=po.NonNegativeReals
         )
 
-        # Optimizers decision whether to activate aFRR
-        self.block.activation_choice = po.Var(self.timesteps, within=po.Binary)
+        # Optimizers decision whether to activate aFRR in each 4h slot
+        self.block.activation_choice = po.Var(self.slots, within=po.Binary)
 
-        # Copy of the power request to pyomo data format
-        self.block.power_request = po.Param(
-            self.timesteps,
-            initialize=self.request_profile,
-            within=po.NonNegativeReals
-        )
-
-        # Copy the peak power revenue to pyomo data format
-        self.block.possible_capacity_revenue = po.Param(
-            self.timesteps,
-            initialize=self.capacity_prices,
-            within=po.NonNegativeReals
-        )
+        # Copy the inputs to pyomo data format
+        _add_params(self.block, [
+            # Binary power request
+            ('power_request', self.timesteps, self.request_profile.tolist(), po.Reals),
+            # 4h capacity prices
+            ('possible_capacity_revenue', self.slots, self.capacity_prices.tolist(), po.Reals),
+            # Probability of volume bid acceptance
+            ('bid_accept', self.timesteps, self.stoch_row.tolist(), po.Integers),
+        ])
 
         # Real capacity revenue with respect to optimizers decisions
         self.block.capacity_revenue = po.Var(self.timesteps, within=po.NonNegativeReals)
 
         # Volume to be bid [kW]
-        self.block.volume = po.Var(self.timesteps, within=po.NonNegativeReals)
+        self.block.volume = po.Var(self.timesteps, bounds=(0, self.params['afrr_max_vol']), within=po.NonNegativeReals)
 
-        # Probability of volume bid acceptance
-        self.block.bid_accept = po.Param(self.timesteps, initialize=self.stoch_row, within=po.Binary)
+        # Volume bid if activated, the product of activation choice and volume [kW]
+        if self.params['afrr_levels']:
+            # Discrete levels already force the volume bid to zero without activation
+            self.activated_volume = self.block.volume
+        else:
+            self.block.activated_volume = po.Var(self.timesteps, within=po.NonNegativeReals)
+            self.activated_volume = self.block.activated_volume
 
 
     def _add_constraints(self):
         """Add constraints to define the custom behavior"""
 
-        # Ensure volume bid of aFRR can only take discrete levels
+        # Ensure volume bid of aFRR can only take discrete levels, none of them without activation
         if self.params['afrr_levels']:
             constraint.DiscreteLevels(
                 model=self.model,
                 params=self.params,
                 flow=self.block.volume,
                 levels=list(range(
-                    self.params['afrr_min_vol'], self.params['afrr_max_vol'] + 1, self.params['afrr_step_size'])))
-
-        def reach1_rule(block: po.Block, t: int):
-            """Ensure the provision of control reserve in equally distant 4h slots"""
-            if t > 0 and t % self.duration != 0:
-                return block.activation_choice[t] == block.activation_choice[t - 1]
-            else:
-                return po.Constraint.Skip
+                    self.params['afrr_min_vol'], self.params['afrr_max_vol'] + 1, self.params['afrr_step_size'])),
+                choice=self.block.activation_choice,
+                duration=self.duration)
+        # Otherwise linearize the product of activation choice and volume
+        else:
+            constraint.BinaryProduct(
+                model=self.model,
+                params=self.params,
+                choice=self.block.activation_choice,
+                flow=self.block.volume,
+                product=self.block.activated_volume,
+                big_M=self.params['afrr_max_vol'],
+                duration=self.duration)
 
-        self.block.reach1_constraint = po.Constraint(self.timesteps, rule=reach1_rule)
+        # Coefficients of the activated volume, precomputed once instead of two Param lookups per rule call
+        request_coefs = (-self.request_profile * self.stoch_row).tolist()
+        revenue_coefs = (-self.capacity_prices * self.stoch_indices).tolist()
+        duration = self.duration
 
         def multiplication_rule(block: po.Block, t: po.Set):
             """Set the flow to match the power request when optimizer thinks aFRR is needed"""
-            return block.flow[t] == block.power_request[t] * block.activation_choice[t] * block.volume[t] * block.bid_accept[t]
+            return LinearExpression(
+                constant=0,
+                linear_coefs=[1, request_coefs[t]],
+                linear_vars=[block.flow[t], self.activated_volume[t]]
+            ) == 0
 
         self.block.multiplication_constraint = po.Constraint(self.timesteps, rule=multiplication_rule)
 
         def capacity_revenue_rule(block: po.Block, t: po.Set):
             """Compute the real capacity revenue with respect to the optimizers decisions"""
-            return block.capacity_revenue[t] == block.activation_choice[t] * block.possible_capacity_revenue[t] * block.volume[t] * block.bid_accept[t]
+            return LinearExpression(
+                constant=0,
+                linear_coefs=[1, revenue_coefs[t // duration]],
+                linear_vars=[block.capacity_revenue[t], self.activated_volume[t]]
+            ) == 0
 
         self.block.capacity_revenue_constraint = po.Constraint(self.timesteps, rule=capacity_revenue_rule)
 
 
-    def get_results(self, t: int, name: str) -> None:
-        """Print out all variables to the terminal"""
-        print(f"\n{f'{name} Capacity Price:':<{self.params['val_pos']}} {self.capacity_prices[t]:.2f} ct/kW")
-        print(f"{f'{name} Flow:':<{self.params['val_pos']}} {self.block.flow[t].value:.2f} kW")
-        print(f"{f'{name} Activation Choice:':<{self.params['val_pos']}} {self.block.activation_choice[t].value:.0f}")
-        print(f"{f'{name} 4h-Bid-accept profile (probabilistic):':<{self.params['val_pos']}} {self.stoch_indices}")
-        print(f"{f'{name} Current Bid accepted (probabilistic):':<{self.params['val_pos']}} {self.block.bid_accept[t]:.0f}")
-        print(f"{f'{name} absolute Power Request:':<{self.params['val_pos']}} {self.block.power_request[t]:.0f}")
-        print(f"{f'{name} relative Power Request:':<{self.params['val_pos']}} {self.block.power_request[t]*100:.2f} %")
-        print(f"{f'{name} Volume Bid:':<{self.params['val_pos']}} {self.block.volume[t].value:.2f} kW")
-        print(f"{f'{name} Capacity Price:':<{self.params['val_pos']}} {self.capacity_prices[t]:.2f} ct/kW")
-        print(f"{f'{name} Energy Price:':<{self.params['val_pos']}} {self.energy_prices[t]:.2f} ct/kWh")
\ No newline at end of file
+    def get_results(self, t: int, name: str) -> list[str]:
+        """Return the report lines of all variables"""
+        return [
+            f"\n{f'{name} Capacity Price:':<{self.params['val_pos']}} {self.capacity_prices[t // self.duration]:.2f} ct/kW",
+            f"{f'{name} Flow:':<{self.params['val_pos']}} {self.block.flow[t].value:.2f} kW",
+            f"{f'{name} Activation Choice:':<{self.params['val_pos']}} {self.block.activation_choice[t // self.duration].value:.0f}",
+            f"{f'{name} 4h-Bid-accept profile (probabilistic):':<{self.params['val_pos']}} {self.stoch_indices}",
+            f"{f'{name} Current Bid accepted (probabilistic):':<{self.params['val_pos']}} {self.block.bid_accept[t]:.0f}",
+            f"{f'{name} absolute Power Request:':<{self.params['val_pos']}} {self.block.power_request[t]:.0f}",
+            f"{f'{name} relative Power Request:':<{self.params['val_pos']}} {self.block.power_request[t]*100:.2f} %",
+            f"{f'{name} Volume Bid:':<{self.params['val_pos']}} {self.block.volume[t].value:.2f} kW",
+            f"{f'{name} Capacity Price:':<{self.params['val_pos']}} {self.capacity_prices[t // self.duration]:.2f} ct/kW",
+            f"{f'{name} Energy Price:':<{self.params['val_pos']}} {self.energy_prices[t]:.2f} ct/kWh",
+        ]
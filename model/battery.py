@@ -1,4 +1,8 @@
+from __future__ import annotations
+
 import pyomo.environ as po
+from pyomo.core.expr.numeric_expr import LinearExpression
+import numpy as np
 
 class Battery:
     def __init__(self, model: po.Model, params: dict):
@@ -14,7 +18,41 @@ class Battery:
     def _get_inputs(self):
         """Get all relevant inputs"""
 
-        pass
+        # Length of one timestep in hours and amount of timesteps per day
+        self.step_hours = 0.25 * self.params['agg_factor']
+        steps_per_day = 96 // self.params['agg_factor']
+
+        # Change of SoC per kW of flow within one timestep [kWh/kW]
+        self.soc_coefficient = self.step_hours * self.params['batt_efficiency']
+
+        # Indication whether a timestep is on a weekday, Monday (0) to Friday (4)
+        self.weekday = (np.arange(len(self.timesteps)) // steps_per_day) % 7 < 5
+
+        # Relevant for mobility behavior
+        if self.params['add_mobility']:
+            # Time of day of every timestep
+            time_of_day = np.arange(len(self.timesteps)) % steps_per_day
+
+            # Departure and arrival are given in 15-min intervals
+            dep_step = self.params['dep_step'] // self.params['agg_factor']
+            arr_step = self.params['arr_step'] // self.params['agg_factor']
+
+            # Timesteps of departure and arrival of the vehicle on weekdays
+            self.departure_timesteps = np.flatnonzero(
+                self.weekday & (time_of_day == dep_step)).tolist()
+            self.arrival_timesteps = np.flatnonzero(
+                self.weekday & (time_of_day == arr_step - 1)).tolist()
+
+            # Timesteps on weekdays apart from arrival and timesteps on weekends
+            self.weekday_timesteps = np.flatnonzero(
+                self.weekday & (time_of_day != arr_step - 1)).tolist()
+            self.weekend_timesteps = np.flatnonzero(~self.weekday).tolist()
+
+            # Timesteps in between departure and arrival of the vehicle on weekdays
+            self.meantime_timesteps = np.flatnonzero(
+                self.weekday
+                & (time_of_day >= dep_step + 1)
+                & (time_of_day < arr_step)).tolist()
 
 
     def _init_variables(self):
@@ -44,6 +82,15 @@ class Battery:
             within = po.NonNegativeReals
         )
 
+        # Scaling factors bringing the battery variables to the order of one for the solver, a size of zero stays unscaled
+        if self.params['scale_model']:
+            self.block.scaling_factor = po.Suffix(direction=po.Suffix.EXPORT)
+            if self.params['batt_power'] > 0:
+                self.block.scaling_factor[self.block.flow] = 1 / self.params['batt_power']
+                self.block.scaling_factor[self.block.flow_abs] = 1 / self.params['batt_power']
+            if self.params['batt_capacity'] > 0:
+                self.block.scaling_factor[self.block.soc] = 1 / self.params['batt_capacity']
+
         # Total discharged energy for mobility [kWh]
         self.block.discharged = po.Var(self.timesteps, initialize=0, within=po.Reals)
 
@@ -56,67 +103,47 @@ class Battery:
     def _add_constraints(self):
         """Add constraints to define the custom behavior"""
 
-        def abs_flow_upper_pos_rule(block: po.Block, t: int):
-            """Positive flow contribute to the absolute value"""
-            return block.flow_abs[t] >= block.flow[t]
-
-        self.block.abs_flow_upper_pos_constraint = po.Constraint(self.timesteps, rule=abs_flow_upper_pos_rule)
-
-        def abs_flow_upper_neg_rule(block: po.Block, t: int):
-            """Negative flow contribute to the absolute value"""
-            return block.flow_abs[t] >= -block.flow[t]
+        def abs_flow_upper_rule(block: po.Block, t: int, sign: int):
+            """Positive and negative flow contribute to the absolute value"""
+            return LinearExpression(
+                constant=0,
+                linear_coefs=[1, -sign],
+                linear_vars=[block.flow_abs[t], block.flow[t]]
+            ) >= 0
 
-        self.block.abs_flow_upper_neg_constraint = po.Constraint(self.timesteps, rule=abs_flow_upper_neg_rule)
+        self.block.abs_flow_upper_constraint = po.Constraint(self.timesteps, [1, -1], rule=abs_flow_upper_rule)
 
 
         if self.params['batt_balanced']:
-
-            def battery_balanced_rule(block: po.Block, t: int):
-                """The SoC at the beginning of the simulation match the one at the end of the simulation"""
-                return block.soc[0] == block.soc[len(self.timesteps) - 1]
-
-            self.block.battery_balanced_constraint = po.Constraint(expr=battery_balanced_rule)
+            # The SoC at the end of the simulation matches the initial SoC at the beginning, fixed instead of constrained
+            self.block.soc[len(self.timesteps) - 1].fix(self.params['batt_initial_soc'] * self.params['batt_capacity'])
 
 
         if self.params['add_mobility']:
 
-            def is_weekday(t):
-                """Returns True if time step t is in a weekday (Mon–Fri)"""
-                steps_per_day = 96
-                day = t // steps_per_day
-                return day < 5  # Monday (0) to Friday (4)
-
             def departure_rule(block: po.Block, t: int):
                 """Set the SoC at the time of departure to meet the users input"""
-                if is_weekday(t) and (t % 96) == self.params['dep_step']:
-                    return block.soc[t] == (self.params['batt_min_soc'] + self.params['dep_user_soc'] / 100 * (self.params['batt_max_soc'] - self.params['batt_min_soc'])) * self.params['batt_capacity']
-                return po.Constraint.Skip
+                return block.soc[t] == (self.params['batt_min_soc'] + self.params['dep_user_soc'] / 100 * (self.params['batt_max_soc'] - self.params['batt_min_soc'])) * self.params['batt_capacity']
 
-            self.block.departure_constraint = po.Constraint(self.timesteps, rule=departure_rule)
+            self.block.departure_constraint = po.Constraint(self.departure_timesteps, rule=departure_rule)
 
             def arrival_rule(block: po.Block, t: int):
                 """Set the SoC at the time of arrival to meet the users input"""
-                if is_weekday(t) and (t % 96) == (self.params['arr_step'] - 1):
-                    return block.soc[t] == (self.params['batt_min_soc'] + self.params['arr_user_soc'] / 100 * (self.params['batt_max_soc'] - self.params['batt_min_soc'])) * self.params['batt_capacity']
-                return po.Constraint.Skip
+                return block.soc[t] == (self.params['batt_min_soc'] + self.params['arr_user_soc'] / 100 * (self.params['batt_max_soc'] - self.params['batt_min_soc'])) * self.params['batt_capacity']
 
-            self.block.arrival_constraint = po.Constraint(self.timesteps, rule=arrival_rule)
+            self.block.arrival_constraint = po.Constraint(self.arrival_timesteps, rule=arrival_rule)
 
             def discharging_weekday_rule(block: po.Block, t: int):
                 """Virtual discharging is happening one step before arrival of the vehicle on weekdays"""
-                if is_weekday(t) and (t % 96) != (self.params['arr_step'] - 1):
-                    return block.charging[t] == 0
-                return po.Constraint.Skip
+                return block.charging[t] == 0
 
-            self.block.discharging_weekday_constraint = po.Constraint(self.timesteps, rule=discharging_weekday_rule)
+            self.block.discharging_weekday_constraint = po.Constraint(self.weekday_timesteps, rule=discharging_weekday_rule)
 
             def discharging_weekend_rule(block: po.Block, t: int):
                 """Virtual discharging is prohibited on weekends"""
-                if not is_weekday(t):
-                    return block.charging[t] == 0
-                return po.Constraint.Skip
+                return block.charging[t] == 0
 
-            self.block.discharging_weekend_constraint = po.Constraint(self.timesteps, rule=discharging_weekend_rule)
+            self.block.discharging_weekend_constraint = po.Constraint(self.weekend_timesteps, rule=discharging_weekend_rule)
 
             def total_discharged_rule(block: po.Block, t: int):
                 """Compute the total discharged energy for mobility over all timesteps"""
@@ -128,19 +155,19 @@ class Battery:
 
             def meantime_flow_rule(block: po.Block, t: int):
                 """The battery is offline in between the time of departure and arrival"""
-                if is_weekday(t):
-                    time_of_day = t % 96
-                    if time_of_day in range(self.params['dep_step'] + 1, self.params['arr_step']):
-                        return block.flow[t] == 0
-                return po.Constraint.Skip
+                return block.flow[t] == 0
 
-            self.block.meantime_flow_constraint = po.Constraint(self.timesteps, rule=meantime_flow_rule)
+            self.block.meantime_flow_constraint = po.Constraint(self.meantime_timesteps, rule=meantime_flow_rule)
 
             def battery_balance_rule(block: po.Block, t: int):
                 """The SoC of the battery will only change upon power input or output"""
                 if t == 0:
                     return block.soc[t] == self.params['batt_initial_soc'] * self.params['batt_capacity']
-                return block.soc[t] == block.soc[t - 1] + 0.25 * self.params['batt_efficiency'] * (block.flow[t] + block.charging[t])
+                return LinearExpression(
+                    constant=0,
+                    linear_coefs=[1, -1, -self.soc_coefficient, -self.soc_coefficient],
+                    linear_vars=[block.soc[t], block.soc[t - 1], block.flow[t], block.charging[t]]
+                ) == 0
 
             self.block.battery_balance_constraint = po.Constraint(self.timesteps, rule=battery_balance_rule)
 
@@ -151,19 +178,24 @@ class Battery:
                 """The SoC of the battery will only change upon power input or output"""
                 if t == 0:
                     return block.soc[t] == self.params['batt_initial_soc'] * self.params['batt_capacity']
-                return block.soc[t] == block.soc[t - 1] + 0.25 * self.params['batt_efficiency'] * block.flow[t]
+                return LinearExpression(
+                    constant=0,
+                    linear_coefs=[1, -1, -self.soc_coefficient],
+                    linear_vars=[block.soc[t], block.soc[t - 1], block.flow[t]]
+                ) == 0
 
             self.block.battery_balance_constraint = po.Constraint(self.timesteps, rule=battery_balance_rule)
 
 
-    def get_results(self, t: int, name: str) -> None:
-        """Print out all variables to the terminal"""
-
-        print(f"\n{f'Flow to the {name}:':<{self.params['val_pos']}} {self.block.flow[t].value:.2f} kW")
-        print(f"{f'Absolute Value of Flow to the {name}:':<{self.params['val_pos']}} {self.block.flow[t].value:.2f} kW")
-        print(f"{f'Total Energy for Mobility:':<{self.params['val_pos']}} {-self.block.discharged[t].value * 0.25:.2f} kWh")
-        print(f"{f'Absolute {name} SoC:':<{self.params['val_pos']}} {self.block.soc[t].value:.2f} kWh")
-        print(f"{f'Relative {name} SoC:':<{self.params['val_pos']}} {self.block.soc[t].value / self.params['batt_capacity'] * 100:.2f} %")
+    def get_results(self, t: int, name: str) -> list[str]:
+        """Return the report lines of all variables"""
+        return [
+            f"\n{f'Flow to the {name}:':<{self.params['val_pos']}} {self.block.flow[t].value:.2f} kW",
+            f"{f'Absolute Value of Flow to the {name}:':<{self.params['val_pos']}} {self.block.flow[t].value:.2f} kW",
+            f"{f'Total Energy for Mobility:':<{self.params['val_pos']}} {-self.block.discharged[t].value * self.step_hours:.2f} kWh",
+            f"{f'Absolute {name} SoC:':<{self.params['val_pos']}} {self.block.soc[t].value:.2f} kWh",
+            f"{f'Relative {name} SoC:':<{self.params['val_pos']}} {self.block.soc[t].value / self.params['batt_capacity'] * 100:.2f} %",
+        ]
 
 
 
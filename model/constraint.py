@@ -1,15 +1,21 @@
 import pyomo.environ as po
+from pyomo.core.expr.numeric_expr import LinearExpression
+from pyomo.gdp import Disjunct, Disjunction
+import numpy as np
 
 
 class DiscreteLevels:
     instantiate_counter = 0
 
-    def __init__(self, model: po.ConcreteModel, params: dict, flow: po.Var, levels: list[float]) -> None:
+    def __init__(self, model: po.ConcreteModel, params: dict, flow: po.Var, levels: list[float], choice: po.Var = None,
+                 index: list[int] = None, duration: int = 1) -> None:
         self.model = model # Model of the simulation
         self.params = params # Parameters of the simulation
         self.flow = flow # Flow to assign the discrete levels to
         self.levels = levels # Discrete levels to be assigned to the flow in [kW]
-        self.timesteps = self.model.timesteps  # Timesteps of the simulation
+        self.choice = choice # Optional binary choice, no level and thus zero flow is selected without it
+        self.timesteps = self.model.timesteps if index is None else index  # Index of the flow, the timesteps by default
+        self.duration = duration # Amount of flow indices sharing one choice
 
         # Counter for naming the blocks uniquely
         DiscreteLevels.instantiate_counter += 1
@@ -27,6 +33,13 @@ class DiscreteLevels:
         # Set of level indices within the block
         self.block.indices = po.Set(initialize=range(len(self.levels)))
 
+        # Upper and lower limit of each level with respect to the tolerance
+        levels = np.array(self.levels, dtype=float)
+        self.block.upper_level = po.Param(
+            self.block.indices, initialize=(levels + self.params['discrete_level_tol']).tolist(), within=po.Reals)
+        self.block.lower_level = po.Param(
+            self.block.indices, initialize=(levels - self.params['discrete_level_tol']).tolist(), within=po.Reals)
+
         # Binary decision variable for each element of levels in each timestep
         self.block.decision = po.Var(self.block.indices, self.timesteps, domain=po.Binary)
 
@@ -34,22 +47,50 @@ class DiscreteLevels:
     def _add_constraints(self):
         """Add constraints to define the custom behavior"""
 
+        # Coefficients of the flow and the decisions, precomputed once for all timesteps
+        upper_coefs = [-1] + [self.block.upper_level[i] for i in self.block.indices]
+        lower_coefs = [-1] + [self.block.lower_level[i] for i in self.block.indices]
+        choice_coefs = [1] * len(self.levels) + ([] if self.choice is None else [-1])
+
+        # Attributes looked up in every rule call
+        flow, choice, duration = self.flow, self.choice, self.duration
+
+        # Decision variables of every timestep, collected once for all three constraint families
+        decisions = {t: [self.block.decision[i, t] for i in self.block.indices] for t in self.timesteps}
+
         def upper_bound_rule(block: po.Block, t: int):
             """Flow must equal one of the discrete levels, based on decision variable"""
-            return self.flow[t] <= sum(
-                (self.levels[i] + self.params['discrete_level_tol']) * block.decision[i, t] for i in block.indices)
+            return LinearExpression(
+                constant=0,
+                linear_coefs=upper_coefs,
+                linear_vars=[flow[t]] + decisions[t]
+            ) >= 0
 
         self.block.upper_bound_constraint = po.Constraint(self.timesteps, rule=upper_bound_rule)
 
         def lower_bound_rule(block: po.Block, t: int):
             """Flow must equal one of the discrete levels, based on decision variable"""
-            return self.flow[t] >= sum((self.levels[i] - self.params['discrete_level_tol']) * block.decision[i, t] for i in block.indices)
+            return LinearExpression(
+                constant=0,
+                linear_coefs=lower_coefs,
+                linear_vars=[flow[t]] + decisions[t]
+            ) <= 0
 
         self.block.lower_bound_constraint = po.Constraint(self.timesteps, rule=lower_bound_rule)
 
         def single_choice_rule(block: po.Block, t: int):
             """Only one discrete level can be selected at each timestep"""
-            return sum(block.decision[i, t] for i in block.indices) == 1
+            if choice is None:
+                return LinearExpression(
+                    constant=0,
+                    linear_coefs=choice_coefs,
+                    linear_vars=decisions[t]
+                ) == 1
+            return LinearExpression(
+                constant=0,
+                linear_coefs=choice_coefs,
+                linear_vars=decisions[t] + [choice[t // duration]]
+            ) == 0
 
         self.block.single_choice_constraint = po.Constraint(self.timesteps, rule=single_choice_rule)
 
@@ -75,7 +116,8 @@ class ForceDuration:
     def _get_inputs(self):
         """Get all relevant inputs"""
 
-        pass
+        # Timesteps that have to follow their predecessor within the duration
+        self.reach_timesteps = [t for t in self.timesteps if t % self.duration != 0]
 
 
     def _init_variables(self):
@@ -85,18 +127,21 @@ class ForceDuration:
         self.block = po.Block()
         self.model.add_component(name=f'ForceDurationBlock{ForceDuration.instantiate_counter}', val=self.block)
 
+        # Set of timesteps following their predecessor within the block
+        self.block.reach_timesteps = po.Set(initialize=self.reach_timesteps, ordered=True)
+
 
     def _add_constraints(self):
         """Add constraints to define the custom behavior"""
 
+        # Attribute looked up in every rule call
+        flow = self.flow
+
         def reach_rule(block: po.Block, t: int):
             """Ensure the flow is constant while duration limits are not reached"""
-            if t > 0 and t % self.duration != 0:
-                return self.flow[t] == self.flow[t - 1]
-            else:
-                return po.Constraint.Skip
+            return LinearExpression(constant=0, linear_coefs=[1, -1], linear_vars=[flow[t], flow[t - 1]]) == 0
 
-        self.block.reach_constraint = po.Constraint(self.timesteps, rule=reach_rule)
+        self.block.reach_constraint = po.Constraint(self.block.reach_timesteps, rule=reach_rule)
 
 
 class MutualExclusivity:
@@ -110,7 +155,7 @@ class MutualExclusivity:
         self.flow_two = flow_two  # Flow of the second partner
         self.timesteps = self.model.timesteps  # Timesteps of the simulation
 
-        # big-M-tuning parameter
+        # big-M-tuning parameter for flows without an upper bound
         self.big_M = self.params['batt_power'] * 100
 
         # Counter for naming the blocks uniquely
@@ -132,22 +177,91 @@ class MutualExclusivity:
         self.block = po.Block()
         self.model.add_component(name=f'MutualExclusivityBlock{MutualExclusivity.instantiate_counter}', val=self.block)
 
-        # Define a binary variable with a unique name, import for when adding multiple constraints of this type
-        self.block.mutual = po.Var(self.timesteps, domain=po.Binary)
+        # big-M values of the idle constraints, only needed where a flow has no upper bound to derive it from
+        self.block.BigM = po.Suffix(direction=po.Suffix.LOCAL)
+
+    def _add_constraints(self):
+        """Add constraints to define the custom behavior"""
+
+        # Attributes looked up in every rule call
+        flow_one, flow_two, big_M = self.flow_one, self.flow_two, self.big_M
+
+        def one_active_rule(disjunct: Disjunct, t: int):
+            """Flow one may be active while flow two is zero"""
+            disjunct.idle_constraint = po.Constraint(expr=flow_two[t] <= 0)
+            if flow_two[t].ub is None:
+                self.block.BigM[disjunct.idle_constraint] = big_M
+
+        self.block.one_active = Disjunct(self.timesteps, rule=one_active_rule)
+
+        def two_active_rule(disjunct: Disjunct, t: int):
+            """Flow two may be active while flow one is zero"""
+            disjunct.idle_constraint = po.Constraint(expr=flow_one[t] <= 0)
+            if flow_one[t].ub is None:
+                self.block.BigM[disjunct.idle_constraint] = big_M
+
+        self.block.two_active = Disjunct(self.timesteps, rule=two_active_rule)
+
+        def mutual_rule(block: po.Block, t: int):
+            """Only one of the two flows can be active at each timestep"""
+            return [block.one_active[t], block.two_active[t]]
+
+        self.block.mutual_disjunction = Disjunction(self.timesteps, rule=mutual_rule)
+
+
+class BinaryProduct:
+    instantiate_counter = 0
+
+    def __init__(self, model: po.Model, params: dict, choice: po.Var, flow: po.Var, product: po.Var, big_M: float,
+                 index: list[int] = None, duration: int = 1) -> None:
+        """Linearize the product of a binary choice and a bounded flow"""
+        self.model = model  # Model of the simulation
+        self.params = params  # Parameters of the simulation
+        self.choice = choice  # Binary variable of the product
+        self.flow = flow  # Continuous flow of the product, bounded by big_M
+        self.product = product  # Variable to take the value of choice times flow
+        self.timesteps = self.model.timesteps if index is None else index  # Index of the flow, the timesteps by default
+        self.duration = duration  # Amount of flow indices sharing one choice
+
+        # big-M-tuning parameter, has to be the upper bound of the flow
+        self.big_M = big_M
+
+        # Counter for naming the blocks uniquely
+        BinaryProduct.instantiate_counter += 1
+
+        self._get_inputs()
+        self._init_variables()
+        self._add_constraints()
+
+    def _get_inputs(self):
+        """Get all relevant inputs"""
+
+        pass
+
+    def _init_variables(self):
+        """Initialize all relevant variables"""
+
+        # Block to store all variables
+        self.block = po.Block()
+        self.model.add_component(name=f'BinaryProductBlock{BinaryProduct.instantiate_counter}', val=self.block)
 
     def _add_constraints(self):
         """Add constraints to define the custom behavior"""
 
-        def mutual_rule_one(block: po.Block, t: po.Set):
-            """Flow one is smaller than a threshold activated by the binary variable mutual"""
-            return self.flow_one[t] <= self.big_M * block.mutual[t]
+        def choice_rule(block: po.Block, t: int):
+            """The product vanishes when the choice is not taken"""
+            return self.product[t] <= self.big_M * self.choice[t // self.duration]
 
-        self.block.mutual_constraint_one = po.Constraint(self.timesteps, rule=mutual_rule_one)
+        self.block.choice_constraint = po.Constraint(self.timesteps, rule=choice_rule)
 
-        def mutual_rule_two(block: po.Block, t: po.Set):
-            """Flow two is smaller than a threshold and can not be activated while flow one is"""
-            return self.flow_two[t] <= self.big_M * (1 - block.mutual[t])
+        def upper_bound_rule(block: po.Block, t: int):
+            """The product never exceeds the flow"""
+            return self.product[t] <= self.flow[t]
 
-        self.block.mutual_constraint_two = po.Constraint(self.timesteps, rule=mutual_rule_two)
+        self.block.upper_bound_constraint = po.Constraint(self.timesteps, rule=upper_bound_rule)
 
+        def lower_bound_rule(block: po.Block, t: int):
+            """The product matches the flow when the choice is taken"""
+            return self.product[t] >= self.flow[t] - self.big_M * (1 - self.choice[t // self.duration])
 
+        self.block.lower_bound_constraint = po.Constraint(self.timesteps, rule=lower_bound_rule)
@@ -1,18 +1,25 @@
+from __future__ import annotations
+
+import pyomo.environ as po
 import pandas as pd
 import numpy as np
+import functools
+import hashlib
 import warnings
 import os
 
-import visualizer
-
 def get_params(path: str, scenario: str) -> dict:
     """Load parameters from a column in an Excel file"""
 
     # Dictionary for the parameters
     params = {}
 
-    # Individual reader
-    reader = pd.read_excel(path, engine='openpyxl')
+    # Individual reader, the faster calamine engine is optional and openpyxl is the fallback
+    # Older pandas versions do not know the calamine engine and raise a ValueError instead
+    try:
+        reader = pd.read_excel(path, engine='calamine')
+    except (ImportError, ValueError):
+        reader = pd.read_excel(path, engine='openpyxl')
 
     # Define keys for the conversion of the text in the Excel file
     conversion_map = {
@@ -24,11 +31,7 @@ def get_params(path: str, scenario: str) -> dict:
     }
 
     # Load the values from the Excel file
-    for column, row in reader.iterrows():
-        name = row['Name']
-        datatype = row['Datatype']
-        value = row[scenario]
-
+    for name, datatype, value in zip(reader['Name'], reader['Datatype'], reader[scenario]):
         # Convert the value types based on the conversion map
         try:
             value = conversion_map.get(datatype, str)(value)
@@ -39,20 +42,53 @@ def get_params(path: str, scenario: str) -> dict:
     return params
 
 
+def cache_np(func):
+    """Cache the numpy outputs of a file reader in a .npz file next to the read file"""
+
+    @functools.wraps(func)
+    def wrapper(filename: str, column_name: str):
+        # Key the cache by the reader, the file, its modification time and the column
+        path = os.path.join(os.path.dirname(__file__), filename)
+        key = hashlib.sha256(f'{func.__name__}{path}{os.path.getmtime(path)}{column_name}'.encode()).hexdigest()[:16]
+        cache_path = os.path.join(os.path.dirname(path), '.cache', f'{key}.npz')
+
+        # Load the outputs on a cache hit
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                if 'outputs' in cached.files:
+                    return cached['outputs']
+                return tuple(cached[f'arr_{i}'] for i in range(len(cached.files)))
+
+        # Otherwise read the file and store the outputs, each process replaces the cache file only once its own is complete
+        outputs = func(filename=filename, column_name=column_name)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(f'{cache_path}.{os.getpid()}.tmp', 'wb') as file:
+            if isinstance(outputs, tuple):
+                np.savez(file, *outputs)
+            else:
+                np.savez(file, outputs=outputs)
+        os.replace(f'{cache_path}.{os.getpid()}.tmp', cache_path)
+
+        return outputs
+
+    return wrapper
+
+
+@cache_np
 def get_frequencies(filename: str, column_name: str) -> tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
     """Get second-wise frequency data from a file in the directory and convert it to 15-min-wise"""
 
     # Open the directory and read the file
     path = os.path.join(os.path.dirname(__file__), filename)
-    data = pd.read_csv(path, sep=",")
+    data = pd.read_csv(path, sep=",", usecols=[column_name], dtype={column_name: 'float64'}, engine='c')
 
-    # Get the second-wise frequency profile
-    sec_profile = np.array(data[column_name])
+    # Get the second-wise frequency profile without copying the column
+    sec_profile = data[column_name].to_numpy()
 
     # Check for invalid value
-    for idx, value in enumerate(sec_profile):
-        if np.isnan(value) or np.isinf(value):
-            warnings.warn(f"Invalid value of frequency data (NaN or inf) found at index {idx}: {value}")
+    invalid = ~np.isfinite(sec_profile)
+    if invalid.any():
+        warnings.warn(f"Invalid values of frequency data (NaN or inf) found at indices {np.flatnonzero(invalid)}")
 
     # Compute frequency deviations
     nominal_frequency = 50
@@ -69,24 +105,24 @@ def get_frequencies(filename: str, column_name: str) -> tuple[np.ndarray,np.ndar
     indices_4h = np.arange(0, len(sec_deviations), bid_length) # [0, 14400, 28800, ..., 72000]
 
     # Sum of positive deviations
-    sec_pos_dev = sec_deviations.copy()
-    sec_pos_dev[sec_pos_dev < dead_band_lower] = 0 # no deployment below 50.01 Hz
-    sec_pos_dev[sec_pos_dev > dead_band_upper] = 0 # no deployment above 50.20 Hz
+    # No deployment below 50.01 Hz and above 50.20 Hz
+    sec_pos_dev = np.where(
+        (sec_deviations < dead_band_lower) | (sec_deviations > dead_band_upper), 0.0, sec_deviations)
     # Average of deviations for every slot of 900
     min_avrg_pos_dev = np.add.reduceat(sec_pos_dev, indices_15min)/interval_length
     # Max of deviations for every slot of 14400
-    pos_dev_maximum = np.array([sec_pos_dev[i:i + bid_length].max() for i in indices_4h])
+    pos_dev_maximum = np.maximum.reduceat(sec_pos_dev, indices_4h)
     # Repeat to get size of 96 again
     pos_dev_maximum = pos_dev_maximum.repeat(16)
 
     # Sum of negative deviations
-    sec_neg_dev = sec_deviations.copy()
-    sec_neg_dev[sec_neg_dev > -dead_band_lower] = 0  # no deployment above 49.99 Hz
-    sec_neg_dev[sec_neg_dev < -dead_band_upper] = 0  # no deployment below 49.80 Hz
+    # No deployment above 49.99 Hz and below 49.80 Hz
+    sec_neg_dev = np.where(
+        (sec_deviations > -dead_band_lower) | (sec_deviations < -dead_band_upper), 0.0, sec_deviations)
     # Average of deviations for every slot of 900
     min_avrg_neg_dev = np.add.reduceat(sec_neg_dev, indices_15min)/interval_length
     # Max of deviations for every slot of 14400
-    neg_dev_maximum = np.array([sec_neg_dev[i:i + bid_length].min() for i in indices_4h])
+    neg_dev_maximum = np.minimum.reduceat(sec_neg_dev, indices_4h)
     # Repeat to get size of 96 again
     neg_dev_maximum = neg_dev_maximum.repeat(16)
 
@@ -94,26 +130,191 @@ def get_frequencies(filename: str, column_name: str) -> tuple[np.ndarray,np.ndar
 
     return dev_tuple
 
+
+def aggregate(profile: np.ndarray, factor: int, reducer=np.mean) -> np.ndarray:
+    """Aggregate a 15-min-wise profile to the time resolution of the simulation"""
+
+    # The 15-min resolution is kept as it is
+    if factor == 1:
+        return profile
+
+    # Reduce every group of consecutive 15-min values to one value
+    groups = profile[:len(profile) - len(profile) % factor].reshape(-1, factor)
+
+    return reducer(groups, axis=1)
+
+
+@functools.lru_cache(maxsize=None)
+def get_tiled_frequencies(filename: str, column_name: str, days: int) -> tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+    """Get the 15-min-wise frequency deviations repeated over the days of the simulation"""
+
+    # Tile the daily data to match the simulation duration
+    dev_tuple = tuple(
+        np.tile(deviation, days) for deviation in get_frequencies(filename=filename, column_name=column_name))
+
+    # The cached profiles are shared between all callers and must not be altered
+    for deviation in dev_tuple:
+        deviation.setflags(write=False)
+
+    return dev_tuple
+
+@cache_np
 def get_prices(filename: str, column_name: str) -> np.ndarray:
     """Get price data from a file in the directory"""
 
     # Open the directory and read the file
     path = os.path.join(os.path.dirname(__file__), filename)
-    data = pd.read_csv(path, sep=",")
+    data = pd.read_csv(path, sep=",", usecols=[column_name], dtype={column_name: 'float64'}, engine='c')
 
     # Convert the prices from EUR/MW to ct/kW
-    prices_ct_per_kw = np.array(data[column_name] / 10)
+    prices_ct_per_kw = data[column_name].to_numpy() / 10
 
     return prices_ct_per_kw
 
 
-def market_clearing(request_filename: str, bid_filename: str) -> np.ndarray:
+@cache_np
+def get_profile(filename: str, column_name: str) -> np.ndarray:
+    """Get a profile from a file in the directory"""
+
+    # Open the directory and read the file
+    path = os.path.join(os.path.dirname(__file__), filename)
+    data = pd.read_csv(path, sep=",", usecols=[column_name], dtype={column_name: 'float64'}, engine='c')
+
+    return data[column_name].to_numpy()
+
+
+@functools.lru_cache(maxsize=None)
+def get_capacity_prices(filename: str, column_name: str, slots: int) -> np.ndarray:
+    """Get capacity price data of every 4h slot from a file in the directory"""
+
+    # Match the amount of 4h slots in the simulation duration
+    prices = get_prices(filename=filename, column_name=column_name)[:slots]
+
+    # The cached profile is shared between all callers and must not be altered
+    prices.setflags(write=False)
+
+    return prices
+
+
+@functools.lru_cache(maxsize=None)
+def get_spot_prices(filename: str, column_name: str, factor: int, steps: int) -> np.ndarray:
+    """Get spot price data in the time resolution and duration of the simulation from a file in the directory"""
+
+    # Adjust the data to match the time resolution and the simulation duration
+    prices = aggregate(get_prices(filename=filename, column_name=column_name), factor)[:steps]
+
+    # The cached profile is shared between all callers and must not be altered
+    prices.setflags(write=False)
+
+    return prices
+
+
+# In-memory interfaces pass the model through the solver API instead of writing and parsing files
+# All of them accept a warm start, which the APPSI interfaces of Gurobi and CPLEX do not
+IN_MEMORY_SOLVERS = {
+    'gurobi': 'gurobi_direct',
+    'highs': 'appsi_highs',
+    'cplex': 'cplex_direct'
+}
+
+# Name of the option that limits the threads of a solver
+THREAD_OPTIONS = {
+    'gurobi': 'Threads',
+    'highs': 'threads',
+    'cplex': 'threads'
+}
+
+
+def get_solver(name: str, threads: int | None = None):
+    """Get the in-memory interface of a solver if available, otherwise its file-based interface"""
+
+    if name in IN_MEMORY_SOLVERS:
+        solver = po.SolverFactory(IN_MEMORY_SOLVERS[name])
+        if not solver.available(exception_flag=False):
+            solver = po.SolverFactory(name)
+    else:
+        solver = po.SolverFactory(name)
+
+    # Limit the threads, e.g. when several solvers run side by side
+    if threads is not None:
+        if name in THREAD_OPTIONS:
+            solver.options[THREAD_OPTIONS[name]] = threads
+        else:
+            warnings.warn(f"The threads of solver {name} cannot be limited, its default is used")
+
+    return solver
+
+
+def get_values(var: po.Var) -> np.ndarray:
+    """Get the values of an indexed variable as an array in the order of its index"""
+
+    return np.fromiter((var_data.value for var_data in var.values()), dtype=np.float64, count=len(var))
+
+
+def _model_structure(model: po.Model, variables: list) -> str:
+    """Identify a model by the names of its variables and its amount of constraints"""
+
+    amount_constraints = sum(1 for _ in model.component_data_objects(po.Constraint, active=True))
+    names = '\n'.join(var.name for var in variables)
+
+    return hashlib.sha256(f'{amount_constraints}\n{names}'.encode()).hexdigest()
+
+
+def save_warm_start(model: po.Model, filename: str):
+    """Store the variable values of a solved model as starting point of the next run"""
+
+    # Open the directory and get the values in the order of the variables
+    path = os.path.join(os.path.dirname(__file__), filename)
+    variables = list(model.component_data_objects(po.Var))
+    values = np.array([np.nan if var.value is None else var.value for var in variables], dtype=np.float64)
+
+    # Replace the stored values only once the new file of this process is complete
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.{os.getpid()}.tmp', 'wb') as file:
+        np.savez(file, structure=_model_structure(model, variables), values=values)
+    os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+
+def load_warm_start(model: po.Model, filename: str) -> bool:
+    """Initialize the variables with the values of the last run if it solved the same model structure"""
+
+    # Open the directory and read the file
+    path = os.path.join(os.path.dirname(__file__), filename)
+    if not os.path.exists(path):
+        return False
+    with np.load(path) as stored:
+        structure, values = str(stored['structure']), stored['values']
+
+    # The values are only reused for the same variables and amount of constraints
+    variables = list(model.component_data_objects(po.Var))
+    if _model_structure(model, variables) != structure:
+        return False
+
+    # Fixed variables keep the values of the current run
+    for var, value in zip(variables, values.tolist()):
+        if not var.fixed and not np.isnan(value):
+            var.set_value(value, skip_validation=True)
+
+    return True
+
+
+def has_feasible_solution(results, sense) -> bool:
+    """Check whether a solve found a feasible solution that was loaded into the model"""
+
+    # The best feasible objective is the lower bound of a maximization and the upper bound of a minimization
+    if sense == po.maximize:
+        best_feasible = results.problem.lower_bound
+    else:
+        best_feasible = results.problem.upper_bound
+
+    return best_feasible is not None and bool(np.isfinite(best_feasible))
+
+
+def market_clearing(request_filename: str, bid_filename: str, plot: bool = False) -> np.ndarray:
     """Compute the marginal price in aFRR energy auction"""
 
     # Open the request file
-    path = os.path.join(os.path.dirname(__file__), request_filename)
-    data = pd.read_csv(path, sep=",")
-    afrrn_request_profile = np.array(data['Data'])
+    afrrn_request_profile = get_profile(filename=request_filename, column_name='Data')
 
     # Sum up over every 4h period
     interval_length = 16
@@ -122,63 +323,58 @@ def market_clearing(request_filename: str, bid_filename: str) -> np.ndarray:
 
     # Open the bid file
     path = os.path.join(os.path.dirname(__file__), bid_filename)
-    bids = pd.read_csv(path, sep=",")
+    bids = pd.read_csv(
+        path,
+        sep=",",
+        usecols=['Time', 'Price [EUR/MWh]', 'Direction', 'Capacity [MW]'],
+        dtype={'Price [EUR/MWh]': 'float64'}
+    )
 
     # Adjust prices based on direction
-    bids.loc[bids['Direction'] == 'PROVIDER_TO_GRID', 'Price [EUR/MWh]'] *= -1
+    bids['Price [EUR/MWh]'] *= np.where(bids['Direction'].to_numpy() == 'PROVIDER_TO_GRID', -1.0, 1.0)
 
-    # Sort the offered capacity according to the product name
-    capacity_sum = bids.groupby('Time')['Capacity [MW]'].sum()
-    capacity_sum_np = capacity_sum.to_numpy()
-    capacity_av_np = capacity_sum_np.copy()
-    capacity_av_np = np.add.reduceat(capacity_av_np, indices_4h)/interval_length
-    capacity_av_np = capacity_av_np.repeat(interval_length)
+    # Index of every product, so POS_001 to POS_096 etc. for each day, to match the request profile
+    time_codes = pd.factorize(bids['Time'], sort=True)[0]
 
-    # Sort the bids
-    bids_sorted = bids.sort_values(by=['Time', 'Price [EUR/MWh]'])
+    # Sort the bids by product and price, comparing the integer product indices instead of the names
+    order = np.lexsort((bids['Price [EUR/MWh]'].to_numpy(), time_codes))
+    time_ids = time_codes[order]
+    prices = bids['Price [EUR/MWh]'].to_numpy()[order]
+    capacities = bids['Capacity [MW]'].to_numpy()[order]
 
-    # List with all products, so POS_001 to POS_096 etc. for each day
-    times = bids_sorted['Time'].unique()
+    # First bid of every product
+    starts = np.flatnonzero(np.r_[True, time_ids[1:] != time_ids[:-1]])
 
-    # index to match the times (str) to the request profile (int)
-    t_ = 0
+    # Accumulate the capacity within every product by restarting the overall sum at its first bid
+    cumulative_capacity = np.cumsum(capacities)
+    cumulative_capacity -= np.repeat(cumulative_capacity[starts] - capacities[starts], np.diff(np.r_[starts, len(capacities)]))
 
-    # List to collect prices in order
-    clearing_prices_np = np.zeros(672) # Prevent errors with mismatching length becuase of missing data points
+    # The marginal bid is the first one whose accumulated capacity covers the demand of its product
+    covered = cumulative_capacity >= afrrn_request_profile[time_ids]
+    marginal = np.minimum.reduceat(np.where(covered, np.arange(len(prices)), len(prices)), starts)
 
-    for t in times:
-        # Filter the bids for t
-        bids_t = bids_sorted[bids_sorted['Time'] == t]
+    # Clearing price of the marginal bid, none if the demand can not be covered
+    clearing_prices = np.full(len(starts), np.nan)
+    cleared = marginal < len(prices)
+    clearing_prices[cleared] = prices[marginal[cleared]]
 
-        # Demand at this timestep
-        demand_t = afrrn_request_profile[t_]
-        # print(f'Demand: {demand_t} MW')
-        print(bids_t)
-
-        # Loop to accumulate capacity
-        cumulative_capacity = 0
-        clearing_price = np.nan
-
-        for _, row in bids_t.iterrows():
-            cumulative_capacity += row['Capacity [MW]']
-            if cumulative_capacity >= demand_t:
-                clearing_price = row['Price [EUR/MWh]']
-                break
-
-        # Convert list to numpy array and convert to ct/kWh
-        clearing_prices_np[t_] = clearing_price / 10
-
-        t_ += 1  # Move to next timestep
-
-
-
-
-    ###########################################
-    plot = visualizer.Visualizer('Market Clearing', 'Time', '[MW or €/MWh]', '../outputs')
-    plot.append_curve_plot(afrrn_request_profile, 'aFRR Request Profile [MW]', 'black', 'solid')
-    plot.append_curve_plot(capacity_sum_np, 'Offered Capacity [MW]', 'green', 'solid')
-    #plot.append_curve_plot(capacity_av_np, 'Offered Capacity 4h Average [MW]', 'blue', 'solid')
-    plot.append_curve_plot(clearing_prices_np*10, 'Clearing Prices [€/MWh]', 'red', 'solid')
-    plot.generate_curve_plot()
+    # Convert to ct/kWh
+    clearing_prices_np = np.zeros(672) # Prevent errors with mismatching length becuase of missing data points
+    clearing_prices_np[:len(starts)] = clearing_prices / 10
+
+    # Plot the market clearing only on request
+    if plot:
+        import visualizer
+
+        # Sum up the offered capacity of every product
+        capacity_sum_np = np.add.reduceat(capacities, starts)
+        capacity_av_np = np.add.reduceat(capacity_sum_np, indices_4h)/interval_length
+
+        clearing_plot = visualizer.Visualizer('Market Clearing', 'Time', '[MW or €/MWh]', '../outputs')
+        clearing_plot.append_curve_plot(afrrn_request_profile, 'aFRR Request Profile [MW]', 'black', 'solid')
+        clearing_plot.append_curve_plot(capacity_sum_np, 'Offered Capacity [MW]', 'green', 'solid')
+        #clearing_plot.append_curve_plot(capacity_av_np.repeat(interval_length), 'Offered Capacity 4h Average [MW]', 'blue', 'solid')
+        clearing_plot.append_curve_plot(clearing_prices_np*10, 'Clearing Prices [€/MWh]', 'red', 'solid')
+        clearing_plot.generate_curve_plot()
 
     return clearing_prices_np
@@ -1,11 +1,15 @@
+from __future__ import annotations
+
 import pyomo.environ as po
+from pyomo.core.expr.numeric_expr import LinearExpression
 import pandas as pd
 import numpy as np
 import time
 import os
+import sys
+import warnings
 
 import helpers
-import visualizer
 import battery
 import solar
 import spot
@@ -13,51 +17,78 @@ import constraint
 import balancing
 import peaks
 
-def main():
+def main(scenario: str = 'Ref_Sens', overrides: dict | None = None) -> float:
     """STORM - Storage Optimization in regulated markets"""
     # Set the timer for the program execution time
     start_time = time.time()
 
+    # Directories of the inputs and outputs next to the model
+    model_dir = os.path.dirname(os.path.abspath(__file__))
+    output_dir = os.path.join(model_dir, '../outputs')
+
     # Import parameters and settings from an Excel file in the directory
-    params_path = os.path.join(os.path.dirname(__file__), '../Inputs/settings.xlsx')
-    params = helpers.get_params(path=params_path, scenario='Ref_Sens')
+    params_path = os.path.join(model_dir, '../inputs/settings.xlsx')
+    params = helpers.get_params(path=params_path, scenario=scenario)
+    # Settings replaced by the caller, e.g. a sweep turning off the plots
+    params.update(overrides or {})
+
+    # Aggregation of the 15-min timesteps to a coarser time resolution, optional in the settings
+    params.setdefault('agg_factor', 1)
+    if 4 % params['agg_factor'] != 0:
+        raise ValueError("The agg_factor must be 1, 2 or 4 to keep the hourly day-ahead products on the time grid")
+    step_hours = 0.25 * params['agg_factor']
+    step_minutes = 15 * params['agg_factor']
+
+    # Scaling of the battery variables before solving, optional in the settings
+    # It copies the whole model, so it only pays off where the solver struggles with the magnitudes
+    params.setdefault('scale_model', False)
+
+    # Amount of threads of the solver, optional in the settings (the solver's default if not given)
+    params.setdefault('solver_threads', None)
 
     # Set the duration of the simulation
-    intervals = 96 * params['days']
-    indices = list(range(intervals))
+    intervals = 96 * params['days'] // params['agg_factor']
 
+    # Plotting is optional, so the visualizer is only imported when needed
+    if params['plot_inputs'] or params['plot_outputs']:
+        import visualizer
     # Prepare to plot input data
     if params['plot_inputs']:
         input_plot = visualizer.Visualizer(
-            title='_Plot_Inputs',
-            x_label='15-min Time Periods',
+            title=f'_Plot_Inputs_{scenario}',
+            x_label=f'{step_minutes}-min Time Periods',
             y_label='[-]',
-            target_directory="../inputs"
+            target_directory="../inputs",
+            step_length=step_minutes
         )
     # Prepare to plot output data
     if params['plot_outputs']:
         output_plot = visualizer.Visualizer(
-            title='_Plot_Outputs',
-            x_label='15-min Time Periods',
+            title=f'_Plot_Outputs_{scenario}',
+            x_label=f'{step_minutes}-min Time Periods',
             y_label='[kW or kWh]',
-            target_directory="../outputs"
+            target_directory="../outputs",
+            step_length=step_minutes
         )
 
     # Create the Pyomo model
     model = po.ConcreteModel()
-    model.timesteps = po.Set(initialize=indices)
+    # Timesteps as a virtual range, no explicit list of members has to be stored and looked up
+    model.timesteps = po.RangeSet(0, intervals - 1)
     objective_function = 0
 
     # Net frequency pre-processing
     if params['add_fcr'] or params['add_afrrp'] or params['add_afrrn']:
-        avrg_pos_dev, avrg_neg_dev, pos_dev_max, neg_dev_max = helpers.get_frequencies(
+        # The daily data is tiled to match the simulation duration
+        avrg_pos_dev, avrg_neg_dev, pos_dev_max, neg_dev_max = helpers.get_tiled_frequencies(
             filename='../inputs/NET_FREQUENCY_DAILY.csv',
-            column_name='Data')
-        # Tile the data to match the simulation duration
-        avrg_pos_dev = np.tile(avrg_pos_dev, params['days'])
-        pos_dev_max = np.tile(pos_dev_max, params['days'])
-        avrg_neg_dev = np.tile(avrg_neg_dev, params['days'])
-        neg_dev_max = np.tile(neg_dev_max, params['days'])
+            column_name='Data',
+            days=params['days'])
+        # Averages and extremes over the aggregated timesteps
+        avrg_pos_dev = helpers.aggregate(avrg_pos_dev, params['agg_factor'])
+        avrg_neg_dev = helpers.aggregate(avrg_neg_dev, params['agg_factor'])
+        pos_dev_max = helpers.aggregate(pos_dev_max, params['agg_factor'], reducer=np.max)
+        neg_dev_max = helpers.aggregate(neg_dev_max, params['agg_factor'], reducer=np.min)
     # Link the data to the input plot
     if params['plot_inputs']:
         if params['add_afrrn']:
@@ -97,15 +128,11 @@ def main():
     # Load aFRRp request profile
     if params['add_afrrp']:
         afrrp_request_path = '../inputs/aFRRp_REQUEST_WEEKLY.csv'
-        afrrp_path = os.path.join(os.path.dirname(__file__), afrrp_request_path)
-        afrrp_data = pd.read_csv(afrrp_path, sep=",")
-        afrrp_request_profile = np.array(afrrp_data['Data'])
+        afrrp_request_profile = helpers.get_profile(filename=afrrp_request_path, column_name='Data')
     # Load aFRRn request profile
     if params['add_afrrn']:
         afrrn_request_path = '../inputs/aFRRn_REQUEST_WEEKLY.csv'
-        afrrn_path = os.path.join(os.path.dirname(__file__), afrrn_request_path)
-        afrrn_data = pd.read_csv(afrrn_path, sep=",")
-        afrrn_request_profile = np.array(afrrn_data['Data'])
+        afrrn_request_profile = helpers.get_profile(filename=afrrn_request_path, column_name='Data')
 
     # Create a battery
     if params['add_battery']:
@@ -173,7 +200,7 @@ def main():
         )
         if params['plot_inputs']:
             input_plot.append_curve_plot(
-                data=fcr.capacity_prices,
+                data=fcr.capacity_prices.repeat(fcr.duration),
                 name='FCR Capacity Prices [ct/kW]',
                 color='grey',
                 style='solid'
@@ -199,7 +226,7 @@ def main():
                 style='dash'
             )
             input_plot.append_curve_plot(
-                data=afrrn.capacity_prices,
+                data=afrrn.capacity_prices.repeat(afrrn.duration),
                 name='aFRR- Capacity Prices [ct/kW]',
                 color='grey',
                 style='solid'
@@ -225,7 +252,7 @@ def main():
                 style='dash'
             )
             input_plot.append_curve_plot(
-                data=afrrp.capacity_prices,
+                data=afrrp.capacity_prices.repeat(afrrp.duration),
                 name='aFRR+ Capacity Prices [ct/kW]',
                 color='grey',
                 style='solid'
@@ -242,14 +269,14 @@ def main():
             model=model,
             params=params,
             flow=da_buy.block.flow,
-            duration=4
+            duration=4 // params['agg_factor']
         )
     if params['add_da_sell']:
         constraint.ForceDuration(
             model=model,
             params=params,
             flow=da_sell.block.flow,
-            duration=4
+            duration=4 // params['agg_factor']
         )
     # Discrete levels for spot market trading
     if params['spot_levels']:
@@ -283,119 +310,36 @@ def main():
                 levels=list(range(params['spot_min_vol'], params['spot_max_vol'] + 1, params['spot_step_size'])))
     # Prohibition of opposing market trading (i.e. FCR+ and aFRR-)
     if params['no_counter_trade']:
-        # No simultaneous trading at ID market
-        if params['add_id_buy'] and params['add_id_sell']:
-            constraint.MutualExclusivity(
-                model=model,
-                params=params,
-                flow_one=id_buy.block.flow,
-                flow_two=id_sell.block.flow
-            )
-        # No simultaneous trading at DA market
-        if params['add_da_buy'] and params['add_da_sell']:
-            constraint.MutualExclusivity(
-                model=model,
-                params=params,
-                flow_one=da_buy.block.flow,
-                flow_two=da_sell.block.flow
-            )
-        # No simultaneous trading at SPOT market and FCR at the same time
-        if params['add_fcr']:
-            # Conflict between ID-buy and FCRp
-            if params['add_id_buy']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=id_buy.block.flow,
-                    flow_two=fcr.block.flow_sink
-                )
-            # Conflict between ID-sell and FCRn
-            if params['add_id_sell']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=id_sell.block.flow,
-                    flow_two=fcr.block.flow_source
-                )
-            # Conflict between DA-buy and FCRp
-            if params['add_da_buy']:
+        # Flows that must not be active at the same time, listed by the markets they belong to
+        conflicts = [
+            # No simultaneous trading at ID market
+            ('add_id_buy', lambda: id_buy.block.flow, 'add_id_sell', lambda: id_sell.block.flow),
+            # No simultaneous trading at DA market
+            ('add_da_buy', lambda: da_buy.block.flow, 'add_da_sell', lambda: da_sell.block.flow),
+            # No simultaneous trading at SPOT market and FCR at the same time
+            ('add_id_buy', lambda: id_buy.block.flow, 'add_fcr', lambda: fcr.block.flow_sink),
+            ('add_id_sell', lambda: id_sell.block.flow, 'add_fcr', lambda: fcr.block.flow_source),
+            ('add_da_buy', lambda: da_buy.block.flow, 'add_fcr', lambda: fcr.block.flow_sink),
+            ('add_da_sell', lambda: da_sell.block.flow, 'add_fcr', lambda: fcr.block.flow_source),
+            # No simultaneous trading at SPOT market and aFRRn at the same time
+            ('add_id_sell', lambda: id_sell.block.flow, 'add_afrrn', lambda: afrrn.block.flow),
+            ('add_da_sell', lambda: da_sell.block.flow, 'add_afrrn', lambda: afrrn.block.flow),
+            # No simultaneous trading at SPOT market and aFRRp at the same time
+            ('add_id_buy', lambda: id_buy.block.flow, 'add_afrrp', lambda: afrrp.block.flow),
+            ('add_da_buy', lambda: da_buy.block.flow, 'add_afrrp', lambda: afrrp.block.flow),
+            # No simultaneous trading at FCR and aFRR at the same time
+            ('add_fcr', lambda: fcr.block.flow_sink, 'add_afrrn', lambda: afrrn.block.flow),
+            ('add_fcr', lambda: fcr.block.flow_source, 'add_afrrp', lambda: afrrp.block.flow),
+            # No simultaneous trading at aFRRn and aFRRp at the same time
+            ('add_afrrn', lambda: afrrn.block.flow, 'add_afrrp', lambda: afrrp.block.flow),
+        ]
+        for flag_one, flow_one, flag_two, flow_two in conflicts:
+            if params[flag_one] and params[flag_two]:
                 constraint.MutualExclusivity(
                     model=model,
                     params=params,
-                    flow_one=da_buy.block.flow,
-                    flow_two=fcr.block.flow_sink
-                )
-            # Conflict between DA-sell and FCRn
-            if params['add_da_sell']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=da_sell.block.flow,
-                    flow_two=fcr.block.flow_source
-                )
-        # No simultaneous trading at SPOT market and aFRRn at the same time
-        if params['add_afrrn']:
-            # Conflict between ID-sell and aFRRn
-            if params['add_id_sell']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=id_sell.block.flow,
-                    flow_two=afrrn.block.flow
-                )
-            # Conflict between DA-sell and aFRRn
-            if params['add_da_sell']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=da_sell.block.flow,
-                    flow_two=afrrn.block.flow
-                )
-        # No simultaneous trading at SPOT market and aFRRp at the same time
-        if params['add_afrrp']:
-            # Conflict between ID-buy and aFRRp
-            if params['add_id_buy']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=id_buy.block.flow,
-                    flow_two=afrrp.block.flow
-                )
-            # Conflict between DA-buy and FCRp
-            if params['add_da_buy']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=da_buy.block.flow,
-                    flow_two=afrrp.block.flow
-                )
-        # No simultaneous trading at FCR and aFRR at the same time
-        if params['add_fcr']:
-            # Conflict between FCRp and aFRRn
-            if params['add_afrrn']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=fcr.block.flow_sink,
-                    flow_two=afrrn.block.flow
-                )
-            # Conflict between FCRn and aFRRp
-            if params['add_afrrp']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=fcr.block.flow_source,
-                    flow_two=afrrp.block.flow
-                )
-        # No simultaneous trading at aFRRn and aFRRp at the same time
-        if params['add_afrrn']:
-            # Conflict between FCRp and aFRRn
-            if params['add_afrrp']:
-                constraint.MutualExclusivity(
-                    model=model,
-                    params=params,
-                    flow_one=afrrn.block.flow,
-                    flow_two=afrrp.block.flow
+                    flow_one=flow_one(),
+                    flow_two=flow_two()
                 )
     # Peak Shaving
     if params['add_ps']:
@@ -414,156 +358,169 @@ def main():
             ps_relevant.append(afrrn.block.flow)
         # Add Constraint
         ps = peaks.PeakShaving(model=model, params=params, flow_list=ps_relevant)
-    # The FCR volume bid can never exceed the sum of battery power and PV power
-    if params['add_battery'] and params['add_fcr']:
-        def fcr_volume_exceed_rule(model: po.Model, t: int):
-            return fcr.block.volume[t] <= (
-                params['batt_power'] + pv.block.power[t] if params['add_pv'] else params['batt_power'])
-
-        model.fcr_volume_exceed_constraint = po.Constraint(model.timesteps, rule=fcr_volume_exceed_rule)
-    # The aFRRp volume bid can never exceed the sum of battery power and PV power
-    if params['add_battery'] and params['add_afrrp']:
-        def afrrp_volume_exceed_rule(model: po.Model, t: int):
-            return afrrp.block.volume[t] <= (
-                params['batt_power'] + pv.block.power[t] if params['add_pv'] else params['batt_power'])
-
-        model.afrrp_volume_exceed_constraint = po.Constraint(model.timesteps, rule=afrrp_volume_exceed_rule)
-
-    # Energy balance
+    # The FCR and aFRRp volume bids can never exceed the sum of battery power and PV power
+    # The PV power is known in advance, so the sums are precomputed and set as bounds of the volume bids
+    if params['add_battery'] and (params['add_fcr'] or params['add_afrrp']):
+        volume_limits = np.full(intervals, float(params['batt_power']))
+        if params['add_pv']:
+            volume_limits += pv.power
+        if params['add_fcr']:
+            # The volume bid of a 4h slot is limited by the lowest sum within the slot
+            slot_limits = volume_limits.reshape(-1, fcr.duration).min(axis=1)
+            for s, limit in zip(fcr.slots, slot_limits.tolist()):
+                fcr.block.volume[s].setub(min(fcr.block.volume[s].ub, limit))
+        if params['add_afrrp']:
+            for t, limit in enumerate(volume_limits.tolist()):
+                afrrp.block.volume[t].setub(min(afrrp.block.volume[t].ub, limit))
+
+    # Energy balance, the flows of the enabled components are collected once with their sign
+    balance_terms = []
+    if params['add_battery']:
+        balance_terms.append((-1, batt.block.flow))
+    if params['add_pv']:
+        balance_terms.append((1, pv.block.flow))
+    if params['add_id_buy']:
+        balance_terms.append((1, id_buy.block.flow))
+    if params['add_id_sell']:
+        balance_terms.append((-1, id_sell.block.flow))
+    if params['add_da_buy']:
+        balance_terms.append((1, da_buy.block.flow))
+    if params['add_da_sell']:
+        balance_terms.append((-1, da_sell.block.flow))
+    if params['add_fcr']:
+        balance_terms.append((1, fcr.block.flow_source))
+        balance_terms.append((-1, fcr.block.flow_sink))
+    if params['add_afrrn']:
+        balance_terms.append((1, afrrn.block.flow))
+    if params['add_afrrp']:
+        balance_terms.append((-1, afrrp.block.flow))
+    balance_coefs = [sign for sign, _ in balance_terms]
+    balance_flows = [flow for _, flow in balance_terms]
+
     def power_balance_rule(model: po.Model, t: int):
         """Energy can neither be created nor destroyed within the system"""
-        return (0 ==
-                - (batt.block.flow[t] if params['add_battery'] else 0)
-                + (pv.block.flow[t] if params['add_pv'] else 0)
-                + (id_buy.block.flow[t] if params['add_id_buy'] else 0)
-                - (id_sell.block.flow[t] if params['add_id_sell'] else 0)
-                + (da_buy.block.flow[t] if params['add_da_buy'] else 0)
-                - (da_sell.block.flow[t] if params['add_da_sell'] else 0)
-                + (fcr.block.flow_source[t] if params['add_fcr'] else 0)
-                - (fcr.block.flow_sink[t] if params['add_fcr'] else 0)
-                + (afrrn.block.flow[t] if params['add_afrrn'] else 0)
-                - (afrrp.block.flow[t] if params['add_afrrp'] else 0)
-                )
+        return LinearExpression(
+            constant=0,
+            linear_coefs=balance_coefs,
+            linear_vars=[flow[t] for flow in balance_flows]
+        ) == 0
 
     model.power_balance_constraint = po.Constraint(model.timesteps, rule=power_balance_rule)
 
-    # Define the objective function [EUR-ct]
+    # Define the objective function [EUR-ct], the coefficients per timestep are kept to report the single terms
+    # and converted to lists of floats, which are indexed faster than numpy arrays
     if params['add_battery']:
         # Cost of energy throughput to the battery
-        batt_operating_cost = {
-            t: 0.25 * batt.block.flow_abs[t] * params['batt_op_cost']
-            for t in model.timesteps
-        }
-        total_batt_operating_cost = sum(batt_operating_cost.values())
+        batt_operating_coef = step_hours * params['batt_op_cost']
+        total_batt_operating_cost = po.quicksum(
+            batt_operating_coef * batt.block.flow_abs[t] for t in model.timesteps)
         objective_function -= total_batt_operating_cost
     if params['add_pv']:
         # Cost of energy produced by the PV-system
-        pv_generation_cost = {
-            t: 0.25 * pv.block.flow[t] * params['pv_cost']
-            for t in model.timesteps
-        }
-        total_pv_generation_cost = sum(pv_generation_cost.values())
+        pv_generation_coef = step_hours * params['pv_cost']
+        total_pv_generation_cost = po.quicksum(
+            pv_generation_coef * pv.block.flow[t] for t in model.timesteps)
         objective_function -= total_pv_generation_cost
     if params['add_id_buy']:
         # Cost of energy buy at the intraday market including price switch with full load time
         if params['add_ps'] and params['full_load_time']:
-            id_energy_buy_cost = {
-                t: 0.25 * id_buy.block.flow[t] * (id_buy.prices[t] + ps.block.en_price[t] * 100)
-                for t in model.timesteps
-            }
+            id_energy_buy_coefs = [
+                step_hours * (price + ps.block.en_price * 100) for price in id_buy.prices.tolist()]
         else:
-            id_energy_buy_cost = {
-                t: 0.25 * id_buy.block.flow[t] * (id_buy.prices[t] + params['net_energy_price'] * 100)
-                for t in model.timesteps
-            }
-        total_id_energy_buy_cost = sum(id_energy_buy_cost.values())
+            id_energy_buy_coefs = (step_hours * (id_buy.prices + params['net_energy_price'] * 100)).tolist()
+        total_id_energy_buy_cost = po.quicksum(
+            id_energy_buy_coefs[t] * id_buy.block.flow[t] for t in model.timesteps)
         objective_function -= total_id_energy_buy_cost
     if params['add_id_sell']:
         # Revenue of energy sell at the intraday market
-        id_energy_sell_revenue = {
-            t: 0.25 * id_sell.block.flow[t] * id_sell.prices[t]
-            for t in model.timesteps
-        }
-        total_id_energy_sell_revenue = sum(id_energy_sell_revenue.values())
+        id_energy_sell_coefs = (step_hours * id_sell.prices).tolist()
+        total_id_energy_sell_revenue = po.quicksum(
+            id_energy_sell_coefs[t] * id_sell.block.flow[t] for t in model.timesteps)
         objective_function += total_id_energy_sell_revenue
     if params['add_da_buy']:
         # Cost of energy buy at the day-ahead market including price switch with full load time
         if params['add_ps'] and params['full_load_time']:
-            da_energy_buy_cost = {
-                t: 0.25 * da_buy.block.flow[t] * (da_buy.prices[t] + ps.block.en_price[t] * 100)
-                for t in model.timesteps
-            }
+            da_energy_buy_coefs = [
+                step_hours * (price + ps.block.en_price * 100) for price in da_buy.prices.tolist()]
         else:
-            da_energy_buy_cost = {
-                t: 0.25 * da_buy.block.flow[t] * (da_buy.prices[t] + params['net_energy_price'] * 100)
-                for t in model.timesteps
-            }
-        total_da_energy_buy_cost = sum(da_energy_buy_cost.values())
+            da_energy_buy_coefs = (step_hours * (da_buy.prices + params['net_energy_price'] * 100)).tolist()
+        total_da_energy_buy_cost = po.quicksum(
+            da_energy_buy_coefs[t] * da_buy.block.flow[t] for t in model.timesteps)
         objective_function -= total_da_energy_buy_cost
     if params['add_da_sell']:
         # Revenue of energy sell at the day-ahead market
-        da_energy_sell_revenue = {
-            t: 0.25 * da_sell.block.flow[t] * da_sell.prices[t]
-            for t in model.timesteps
-        }
-        total_da_energy_sell_revenue = sum(da_energy_sell_revenue.values())
+        da_energy_sell_coefs = (step_hours * da_sell.prices).tolist()
+        total_da_energy_sell_revenue = po.quicksum(
+            da_energy_sell_coefs[t] * da_sell.block.flow[t] for t in model.timesteps)
         objective_function += total_da_energy_sell_revenue
     if params['add_fcr']:
-        fcr_capacity_revenue = {
-            t: fcr.block.capacity_revenue[t] / 16
-            for t in model.timesteps
-        }
-        total_fcr_capacity_revenue = sum(fcr_capacity_revenue.values())
+        total_fcr_capacity_revenue = po.quicksum(
+            fcr.block.capacity_revenue[t] / fcr.duration for t in model.timesteps)
         objective_function += total_fcr_capacity_revenue
     if params['add_afrrn']:
         # Revenue of energy part of aFRRn
-        afrrn_energy_revenue = {
-            t: 0.25 * afrrn.block.flow[t] * afrrn.energy_prices[t]
-            for t in model.timesteps
-        }
-        total_afrrn_energy_revenue = sum(afrrn_energy_revenue.values())
+        afrrn_energy_coefs = (step_hours * afrrn.energy_prices).tolist()
+        total_afrrn_energy_revenue = po.quicksum(
+            afrrn_energy_coefs[t] * afrrn.block.flow[t] for t in model.timesteps)
         objective_function += total_afrrn_energy_revenue
         # Revenue of capacity part of aFRRn
-        afrrn_capacity_revenue = {
-            t: afrrn.block.capacity_revenue[t] / 16
-            for t in model.timesteps
-        }
-        total_afrrn_capacity_revenue = sum(afrrn_capacity_revenue.values())
+        total_afrrn_capacity_revenue = po.quicksum(
+            afrrn.block.capacity_revenue[t] / afrrn.duration for t in model.timesteps)
         objective_function += total_afrrn_capacity_revenue
     if params['add_afrrp']:
         # Revenue of energy part of aFRRp
-        afrrp_energy_revenue = {
-            t: 0.25 * afrrp.block.flow[t] * afrrp.energy_prices[t]
-            for t in model.timesteps
-        }
-        total_afrrp_energy_revenue = sum(afrrp_energy_revenue.values())
+        afrrp_energy_coefs = (step_hours * afrrp.energy_prices).tolist()
+        total_afrrp_energy_revenue = po.quicksum(
+            afrrp_energy_coefs[t] * afrrp.block.flow[t] for t in model.timesteps)
         objective_function += total_afrrp_energy_revenue
         # Revenue of capacity part of aFRRp
-        afrrp_capacity_revenue = {
-            t: afrrp.block.capacity_revenue[t] / 16
-            for t in model.timesteps
-        }
-        total_afrrp_capacity_revenue = sum(afrrp_capacity_revenue.values())
+        total_afrrp_capacity_revenue = po.quicksum(
+            afrrp.block.capacity_revenue[t] / afrrp.duration for t in model.timesteps)
         objective_function += total_afrrp_capacity_revenue
     if params['add_ps']:
         if params['full_load_time']:
-            net_capacity_cost = ps.block.cost[len(model.timesteps) - 1] * 100
-            tflt = ps.block.total_supply_power[len(model.timesteps) - 1] / (ps.block.p_max[len(model.timesteps) - 1] + 0.01)
+            net_capacity_cost = ps.block.cost * 100
+            tflt = ps.block.total_supply_power / (ps.block.p_max[len(model.timesteps) - 1] + 0.01)
             tflt_percentage = tflt / len(model.timesteps) * 100
         else:
             net_capacity_cost = ps.block.p_max[len(model.timesteps) - 1] * params['net_capacity_price'] * 100
         objective_function -= net_capacity_cost
 
+    # Reformulate the disjunctions of mutually exclusive flows with big-M values derived from the flow bounds
+    po.TransformationFactory('gdp.bigm').apply_to(model)
+
     # Set up the model
     model.objective = po.Objective(expr=objective_function, sense=po.maximize)
-    solver = po.SolverFactory(params['solver'])
+    solver = helpers.get_solver(params['solver'], threads=params['solver_threads'])
     # solver.options['MIPGap'] = 0.01
+    # Start from the solution of the last run if it solved the same model structure
+    warm_start_path = f'../outputs/.cache/warm_start_{scenario}.npz'
+    warm_start_capable = getattr(solver, 'warm_start_capable', lambda: False)()
+    warm_start = warm_start_capable and helpers.load_warm_start(model=model, filename=warm_start_path)
     # Solve the model
-    meta = solver.solve(model, tee=params['see_meta'])
+    if params['add_battery'] and params['scale_model']:
+        # Solve a copy with the battery variables scaled and map the solution back
+        scaling = po.TransformationFactory('core.scale_model')
+        scaled_model = scaling.create_using(model)
+        meta = solver.solve(scaled_model, tee=params['see_meta'], warmstart=warm_start)
+        scaling.propagate_solution(scaled_model, model)
+    else:
+        meta = solver.solve(model, tee=params['see_meta'], warmstart=warm_start)
+    # Without a feasible solution the variables may still hold the warm start of an earlier run
+    if not helpers.has_feasible_solution(meta, sense=model.objective.sense):
+        raise RuntimeError(f"No feasible solution found for scenario {scenario}: {meta.solver.termination_condition}")
+    # A solve stopped by a limit is reported, but only an optimal solution is reused as warm start
+    if po.check_optimal_termination(meta):
+        helpers.save_warm_start(model=model, filename=warm_start_path)
+    else:
+        warnings.warn(f"The solution of scenario {scenario} is feasible but not proven optimal: {meta.solver.termination_condition}")
 
     # Get the results
+    objective_value = po.value(model.objective) / 100  # [EUR]
+    if params['add_afrrn'] or params['add_afrrp']:
+        os.makedirs(output_dir, exist_ok=True)  # Ensure the directory exists
     if params['add_battery']:
-        batt_soc = [po.value(batt.block.soc[t]) for t in model.timesteps]
+        batt_soc = helpers.get_values(batt.block.soc)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=batt_soc,
@@ -571,7 +528,7 @@ def main():
                 color='black',
                 style='solid'
             )
-        batt_flow = [po.value(batt.block.flow[t]) for t in model.timesteps]
+        batt_flow = helpers.get_values(batt.block.flow)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=batt_flow,
@@ -580,7 +537,7 @@ def main():
                 style='solid'
             )
     if params['add_pv']:
-        pv_source_flow = [po.value(pv.block.flow[t]) for t in model.timesteps]
+        pv_source_flow = helpers.get_values(pv.block.flow)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=pv_source_flow,
@@ -589,7 +546,7 @@ def main():
                 style='solid'
             )
     if params['add_id_buy']:
-        id_source_flow = [po.value(id_buy.block.flow[t]) for t in model.timesteps]
+        id_source_flow = helpers.get_values(id_buy.block.flow)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=id_source_flow,
@@ -598,7 +555,7 @@ def main():
                 style='solid'
             )
     if params['add_id_sell']:
-        id_sink_flow = [po.value(id_sell.block.flow[t]) for t in model.timesteps]
+        id_sink_flow = helpers.get_values(id_sell.block.flow)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=id_sink_flow,
@@ -607,7 +564,7 @@ def main():
                 style='dash'
             )
     if params['add_da_buy']:
-        da_source_flow = [po.value(da_buy.block.flow[t]) for t in model.timesteps]
+        da_source_flow = helpers.get_values(da_buy.block.flow)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=da_source_flow,
@@ -616,7 +573,7 @@ def main():
                 style='solid'
             )
     if params['add_da_sell']:
-        da_sink_flow = [po.value(da_sell.block.flow[t]) for t in model.timesteps]
+        da_sink_flow = helpers.get_values(da_sell.block.flow)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=da_sink_flow,
@@ -625,7 +582,7 @@ def main():
                 style='dash'
             )
     if params['add_fcr']:
-        fcr_flow = [po.value(fcr.block.flow_source[t]) - po.value(fcr.block.flow_sink[t]) for t in model.timesteps]
+        fcr_flow = helpers.get_values(fcr.block.flow_source) - helpers.get_values(fcr.block.flow_sink)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=fcr_flow,
@@ -634,7 +591,7 @@ def main():
                 style='solid'
             )
     if params['add_afrrn']:
-        afrrn_flow = [po.value(afrrn.block.flow[t]) for t in model.timesteps]
+        afrrn_flow = helpers.get_values(afrrn.block.flow)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=afrrn_flow,
@@ -648,14 +605,12 @@ def main():
                 color='grey',
                 style='solid'
             )
-        output_dir = os.path.join(os.path.dirname(__file__), '../outputs')
-        os.makedirs(output_dir, exist_ok=True)  # Ensure the directory exists
-        output_path = os.path.join(output_dir, 'afrrn_clearing_prices.csv')
+        output_path = os.path.join(output_dir, f'afrrn_clearing_prices_{scenario}.csv')
         pd.DataFrame({
             'Clearing Price [€/MWh]': afrrn.energy_prices[:len(model.timesteps)]*10
         }).to_csv(output_path, index=False)
     if params['add_afrrp']:
-        afrrp_flow = [po.value(afrrp.block.flow[t]) for t in model.timesteps]
+        afrrp_flow = helpers.get_values(afrrp.block.flow)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=afrrp_flow,
@@ -669,14 +624,12 @@ def main():
                 color='grey',
                 style='solid'
             )
-        output_dir = os.path.join(os.path.dirname(__file__), '../outputs')
-        os.makedirs(output_dir, exist_ok=True)  # Ensure the directory exists
-        output_path = os.path.join(output_dir, 'afrrp_clearing_prices.csv')
+        output_path = os.path.join(output_dir, f'afrrp_clearing_prices_{scenario}.csv')
         pd.DataFrame({
             'Clearing Price [€/MWh]': afrrp.energy_prices[:len(model.timesteps)]*10
         }).to_csv(output_path, index=False)
     if params['add_mobility']:
-        charging = [po.value(batt.block.charging[t]) for t in model.timesteps]
+        charging = helpers.get_values(batt.block.charging)
         if params['plot_outputs']:
             output_plot.append_curve_plot(
                 data=charging,
@@ -691,86 +644,118 @@ def main():
 
     # Print results to the console
     if params['print_results']:
+        # Labels and totals that are the same in every step
+        if params['add_ps']:
+            ps.cache_results()
+            net_capacity_cost_line = f"{'Total Net Capacity Cost:':<{params['val_pos']}} {po.value(net_capacity_cost) / 100:.2f} €"
+            if params['full_load_time']:
+                tflt_percentage_line = f"{'Total Full Load Time Percentage:':<{params['val_pos']}} {po.value(tflt_percentage):.2f} %"
+                tflt_above_line = f"{'TFLT above limit:':<{params['val_pos']}} {ps.block.delta.value:.1f}"
+        # Collect the lines of every step and write them at once
         for t in range(0, len(model.timesteps)):
-            print("----------------------------------------")
-            print(f"Step {t}:")
+            buf = ["----------------------------------------", f"Step {t}:"]
             if params['add_battery']:
-                batt.get_results(t=t, name="Battery")
-                print(f"{'Battery Operating Cost:':<{params['val_pos']}} {po.value(batt_operating_cost[t]) / 100:.2f} €")
+                buf.extend(batt.get_results(t=t, name="Battery"))
             if params['add_pv']:
-                pv.get_results(t=t, name="PV-System")
-                print(f"{f'PV Generation Cost:':<{params['val_pos']}} {po.value(pv_generation_cost[t]) / 100:.2f} €")
+                buf.extend(pv.get_results(t=t, name="PV-System"))
             if params['add_id_buy']:
-                id_buy.get_results(t=t, name="ID-Source")
-                print(f"{f'ID Energy Buy Cost:':<{params['val_pos']}} {po.value(id_energy_buy_cost[t]) / 100:.2f} €")
+                buf.extend(id_buy.get_results(t=t, name="ID-Source"))
             if params['add_id_sell']:
-                id_sell.get_results(t=t, name="ID-Sink")
-                print(f"{f'ID Energy Sell Revenue:':<{params['val_pos']}} {po.value(id_energy_sell_revenue[t]) / 100:.2f} €")
+                buf.extend(id_sell.get_results(t=t, name="ID-Sink"))
             if params['add_da_buy']:
-                da_buy.get_results(t=t, name="DA-Source")
-                print(f"{f'DA Energy Buy Cost:':<{params['val_pos']}} {po.value(da_energy_buy_cost[t]) / 100:.2f} €")
+                buf.extend(da_buy.get_results(t=t, name="DA-Source"))
             if params['add_da_sell']:
-                da_sell.get_results(t=t, name="DA-Sink")
-                print(f"{f'DA Energy Sell Revenue:':<{params['val_pos']}} {po.value(da_energy_sell_revenue[t]) / 100:.2f} €")
+                buf.extend(da_sell.get_results(t=t, name="DA-Sink"))
             if params['add_fcr']:
-                fcr.get_results(t=t, name="FCR")
-                print(f"{f'FCR Capacity Revenue:':<{params['val_pos']}} {po.value(fcr_capacity_revenue[t]) / 100:.2f} €")
+                buf.extend(fcr.get_results(t=t, name="FCR"))
             if params['add_afrrn']:
-                afrrn.get_results(t=t, name="aFRRn")
-                print(f"{f'aFRRn Capacity Revenue:':<{params['val_pos']}} {po.value(afrrn_capacity_revenue[t]) / 100:.2f} €")
-                print(f"{f'aFRRn Energy Revenue:':<{params['val_pos']}} {po.value(afrrn_energy_revenue[t]) / 100:.2f} €")
+                buf.extend(afrrn.get_results(t=t, name="aFRRn"))
             if params['add_afrrp']:
-                afrrp.get_results(t=t, name="aFRRp")
-                print(f"{f'aFRRp Capacity Revenue:':<{params['val_pos']}} {po.value(afrrp_capacity_revenue[t]) / 100:.2f} €")
-                print(f"{f'aFRRp Energy Revenue:':<{params['val_pos']}} {po.value(afrrp_energy_revenue[t]) / 100:.2f} €")
+                buf.extend(afrrp.get_results(t=t, name="aFRRp"))
             if params['add_ps']:
-                ps.get_results(t=t, name='Peak Shaving')
-                print(f"{f'Total Net Capacity Cost:':<{params['val_pos']}} {po.value(net_capacity_cost) / 100:.2f} €")
+                buf.extend(ps.get_results(t=t, name='Peak Shaving'))
+                buf.append(net_capacity_cost_line)
                 if params['full_load_time']:
-                    print(f"{f'Total Full Load Time Percentage:':<{params['val_pos']}} {po.value(tflt_percentage):.2f} %")
-                    print(f"{f'TFLT above limit:':<{params['val_pos']}} {po.value(ps.block.delta[t].value):.1f}")
+                    buf.append(tflt_percentage_line)
+                    buf.append(tflt_above_line)
+            sys.stdout.write("\n".join(buf) + "\n")
+
+        # Costs and revenues of every timestep in one table [EUR]
+        cost_table = {}
+        if params['add_battery']:
+            cost_table['Battery Operating Cost'] = helpers.get_values(batt.block.flow_abs) * batt_operating_coef
+        if params['add_pv']:
+            cost_table['PV Generation Cost'] = helpers.get_values(pv.block.flow) * pv_generation_coef
+        if params['add_id_buy']:
+            cost_table['ID Energy Buy Cost'] = helpers.get_values(id_buy.block.flow) * np.array(
+                [po.value(coef) for coef in id_energy_buy_coefs])
+        if params['add_id_sell']:
+            cost_table['ID Energy Sell Revenue'] = helpers.get_values(id_sell.block.flow) * id_energy_sell_coefs
+        if params['add_da_buy']:
+            cost_table['DA Energy Buy Cost'] = helpers.get_values(da_buy.block.flow) * np.array(
+                [po.value(coef) for coef in da_energy_buy_coefs])
+        if params['add_da_sell']:
+            cost_table['DA Energy Sell Revenue'] = helpers.get_values(da_sell.block.flow) * da_energy_sell_coefs
+        if params['add_fcr']:
+            cost_table['FCR Capacity Revenue'] = helpers.get_values(fcr.block.capacity_revenue) / fcr.duration
+        if params['add_afrrn']:
+            cost_table['aFRRn Capacity Revenue'] = helpers.get_values(afrrn.block.capacity_revenue) / afrrn.duration
+            cost_table['aFRRn Energy Revenue'] = helpers.get_values(afrrn.block.flow) * afrrn_energy_coefs
+        if params['add_afrrp']:
+            cost_table['aFRRp Capacity Revenue'] = helpers.get_values(afrrp.block.capacity_revenue) / afrrp.duration
+            cost_table['aFRRp Energy Revenue'] = helpers.get_values(afrrp.block.flow) * afrrp_energy_coefs
+        cost_table = pd.DataFrame(cost_table) / 100
+        cost_table.index.name = 'Step'
+        print("----------------------------------------")
+        print(f"Costs and Revenues [€]:\n{cost_table.to_string(float_format='{:.2f}'.format)}")
 
     # Print meta-data to the console
     if params['print_meta']:
         print(f"\n")
-        # Amount of constraints
-        amount_constraints = model.component_data_objects(po.Constraint, active=True)
-        amount_constraints = len(list(amount_constraints))
+        # Amount of constraints, counted without collecting them into a list
+        amount_constraints = sum(1 for _ in model.component_data_objects(po.Constraint, active=True))
         print(f"Amount of Constraints: {amount_constraints}")
 
         # Amount of variables
-        amount_variables = model.component_data_objects(po.Var, active=True)
-        amount_variables = len(list(amount_variables))
+        amount_variables = sum(1 for _ in model.component_data_objects(po.Var, active=True))
         print(f"Amount of Variables: {amount_variables}")
 
         # Objective function
-        print(f"Objective Function Value: {po.value(model.objective) / 100:.2f} €")
+        print(f"Objective Function Value: {objective_value:.2f} €")
         if params['add_battery']:
             print(f"- Battery Operating Cost: {-po.value(total_batt_operating_cost) / 100:.2f} €")
         if params['add_pv']:
             print(f"- PV Generation Cost: {-po.value(total_pv_generation_cost) / 100:.2f} €")
         if params['add_id_buy']:
-            print(f"- ID Energy Buy Cost: {-po.value(total_id_energy_buy_cost) / 100:.2f} €")
+            id_buy_cost = po.value(total_id_energy_buy_cost)
+            print(f"- ID Energy Buy Cost: {-id_buy_cost / 100:.2f} €")
         if params['add_id_sell']:
-            print(f"- ID Energy Sell Revenue: {po.value(total_id_energy_sell_revenue) / 100:.2f} €")
+            id_sell_revenue = po.value(total_id_energy_sell_revenue)
+            print(f"- ID Energy Sell Revenue: {id_sell_revenue / 100:.2f} €")
         if params['add_id_buy'] and params['add_id_sell']:
-            print(f"- ID Result: {(po.value(total_id_energy_sell_revenue)-po.value(total_id_energy_buy_cost)) / 100:.2f} €")
+            print(f"- ID Result: {(id_sell_revenue - id_buy_cost) / 100:.2f} €")
         if params['add_da_buy']:
-            print(f"- DA Energy Buy Cost: {-po.value(total_da_energy_buy_cost) / 100:.2f} €")
+            da_buy_cost = po.value(total_da_energy_buy_cost)
+            print(f"- DA Energy Buy Cost: {-da_buy_cost / 100:.2f} €")
         if params['add_da_sell']:
-            print(f"- DA Energy Sell Revenue: {po.value(total_da_energy_sell_revenue) / 100:.2f} €")
+            da_sell_revenue = po.value(total_da_energy_sell_revenue)
+            print(f"- DA Energy Sell Revenue: {da_sell_revenue / 100:.2f} €")
         if params['add_da_buy'] and params['add_da_sell']:
-            print(f"- DA Result: {(po.value(total_da_energy_sell_revenue)-po.value(total_da_energy_buy_cost)) / 100:.2f} €")
+            print(f"- DA Result: {(da_sell_revenue - da_buy_cost) / 100:.2f} €")
         if params['add_fcr']:
             print(f"- FCR Capacity Revenue: {po.value(total_fcr_capacity_revenue) / 100:.2f} €")
         if params['add_afrrp']:
-            print(f"- aFRR+ Energy Revenue: {po.value(total_afrrp_energy_revenue) / 100:.2f} €")
-            print(f"- aFRR+ Capacity Revenue: {po.value(total_afrrp_capacity_revenue) / 100:.2f} €")
-            print(f"- aFRR+ Result: {(po.value(total_afrrp_energy_revenue) + po.value(total_afrrp_capacity_revenue)) / 100:.2f} €")
+            afrrp_energy_revenue = po.value(total_afrrp_energy_revenue)
+            afrrp_capacity_revenue = po.value(total_afrrp_capacity_revenue)
+            print(f"- aFRR+ Energy Revenue: {afrrp_energy_revenue / 100:.2f} €")
+            print(f"- aFRR+ Capacity Revenue: {afrrp_capacity_revenue / 100:.2f} €")
+            print(f"- aFRR+ Result: {(afrrp_energy_revenue + afrrp_capacity_revenue) / 100:.2f} €")
         if params['add_afrrn']:
-            print(f"- aFRR- Energy Revenue: {po.value(total_afrrn_energy_revenue) / 100:.2f} €")
-            print(f"- aFRR- Capacity Revenue: {po.value(total_afrrn_capacity_revenue) / 100:.2f} €")
-            print(f"- aFRR- Result: {(po.value(total_afrrn_energy_revenue) + po.value(total_afrrn_capacity_revenue)) / 100:.2f} €")
+            afrrn_energy_revenue = po.value(total_afrrn_energy_revenue)
+            afrrn_capacity_revenue = po.value(total_afrrn_capacity_revenue)
+            print(f"- aFRR- Energy Revenue: {afrrn_energy_revenue / 100:.2f} €")
+            print(f"- aFRR- Capacity Revenue: {afrrn_capacity_revenue / 100:.2f} €")
+            print(f"- aFRR- Result: {(afrrn_energy_revenue + afrrn_capacity_revenue) / 100:.2f} €")
 
 
     # Compute the program execution time
@@ -778,5 +763,8 @@ def main():
     execution_time = finish_time - start_time
     print(f"\nExecution time: {execution_time:.1f} seconds.")
 
+    # Objective function value [EUR]
+    return objective_value
+
 if __name__ == "__main__":
     main()
@@ -1,6 +1,9 @@
+from __future__ import annotations
+
 import pyomo.environ as po
+from pyomo.core.expr.numeric_expr import LinearExpression
 
-import constraint
+import helpers
 
 class PeakShaving:
     def __init__(self, model: po.Model, flow_list: list[po.Var], params: dict) -> None:
@@ -8,6 +11,18 @@ class PeakShaving:
         self.params = params  # Parameters of the simulation
         self.timesteps = self.model.timesteps  # Timesteps of the simulation
         self.flow_list = flow_list  # Component from which the flow comes
+        self.step_hours = 0.25 * self.params['agg_factor']  # Length of one timestep [h]
+
+        # Padded labels of the result lines
+        self.labels = {
+            key: f"{label:<{self.params['val_pos']}}" for key, label in {
+                'supply': 'Current Energy Supply from Grid:',
+                'total_supply': 'Total Energy Supply from Grid until now:',
+                'p_max': 'Maximum Power from Grid until now:',
+                'cap_price': 'Net Capacity Price:',
+                'en_price': 'Net Energy Price:',
+            }.items()
+        }
 
         self._get_inputs()
         self._init_variables()
@@ -17,7 +32,10 @@ class PeakShaving:
     def _get_inputs(self):
         """Get all relevant inputs"""
 
-        pass
+        # Highest possible supply from grid, given by the upper bounds of the relevant flows [kW]
+        if any(flow[t].ub is None for flow in self.flow_list for t in self.timesteps):
+            raise ValueError("All flows of the peak shaving need an upper bound")
+        self.peak_bound = max((sum(flow[t].ub for flow in self.flow_list) for t in self.timesteps), default=0)
 
 
     def _init_variables(self):
@@ -30,120 +48,139 @@ class PeakShaving:
         # Supply power from electricity grid in every time step
         self.block.supply_power = po.Var(self.timesteps, within=po.NonNegativeReals)
 
-        # Total supply power from electricity grid
-        self.block.total_supply_power = po.Var(self.timesteps, within=po.NonNegativeReals)
-
         # Variable for storing the peak power over all timestamps
-        self.block.p_max = po.Var(self.timesteps, within=po.NonNegativeReals)
+        self.block.p_max = po.Var(self.timesteps, bounds=(0, self.peak_bound), within=po.NonNegativeReals)
 
         # Special behavior when taking considering full-load hours/time
         if self.params['full_load_time']:
             # Capacity price of electricity supply from grid
-            self.block.cap_price = po.Var(self.timesteps, within=po.NonNegativeReals)
+            self.block.cap_price = po.Var(within=po.NonNegativeReals)
 
             # Energy price of electricity supply from grid
-            self.block.en_price = po.Var(self.timesteps, within=po.NonNegativeReals)
-
-            # Full load time
-            self.block.full_load_time = po.Var(self.timesteps, within=po.NonNegativeReals)
-
-            # Total Full load time
-            self.block.total_full_load_time = po.Var(self.timesteps, within=po.NonNegativeReals)
+            self.block.en_price = po.Var(within=po.NonNegativeReals)
 
-            # Capacity price component of net grid supply costs [€]
-            self.block.cost = po.Var(self.timesteps, within=po.NonNegativeReals)
+            # Capacity price component of net grid supply costs for the peak of the whole horizon [€]
+            self.block.cost = po.Var(within=po.NonNegativeReals)
 
-            # big-M-tuning parameter
-            self.big_M = self.params['days'] * self.params['batt_power'] * 100
+            # big-M-tuning parameter, the total supply and the full-load supply stay below the peak in every timestep
+            self.big_M = len(self.timesteps) * self.peak_bound
 
             # Indication on whether the total full load time is above the limit or not
-            self.block.delta = po.Var(self.timesteps, within=po.Binary)
+            self.block.delta = po.Var(within=po.Binary)
 
 
     def _add_constraints(self):
         """Add constraints to define the custom behavior"""
 
+        last_step = len(self.timesteps) - 1  # Index of the last timestep
+
+        # Supply minus the sum of all relevant flows
+        supply_coefs = [1] + [-1] * len(self.flow_list)
+        flows_by_t = [[flow[t] for flow in self.flow_list] for t in self.timesteps]
+
         def compute_supply_rule(block: po.Block, t: int):
             """Compute the supply from electricity grid for every timestep"""
-            return block.supply_power[t] == sum(flow[t] for flow in self.flow_list)
+            return LinearExpression(
+                constant=0,
+                linear_coefs=supply_coefs,
+                linear_vars=[block.supply_power[t]] + flows_by_t[t]
+            ) == 0
 
         self.block.compute_supply_constraint = po.Constraint(self.timesteps, rule=compute_supply_rule)
 
-        def total_supply_rule(block: po.Block, t: int):
-            """Compute the total supply from electricity grid over all timesteps"""
-            if t > 0:
-                return block.total_supply_power[t] == block.total_supply_power[t - 1] + block.supply_power[t]
-            return block.total_supply_power[t] == 0
-
-        self.block.total_supply_constraint = po.Constraint(self.timesteps, rule=total_supply_rule)
+        # Total supply from electricity grid over all timesteps, the first timestep does not count towards it
+        self.block.total_supply_power = po.Expression(expr=LinearExpression(
+            constant=0,
+            linear_coefs=[1] * last_step,
+            linear_vars=[self.block.supply_power[t] for t in range(1, last_step + 1)]
+        ))
 
         def copy_value_rule(block: po.Block, t: int):
             """Copy the gird source flow values"""
-            return block.p_max[t] >= block.supply_power[t]
+            return LinearExpression(
+                constant=0,
+                linear_coefs=[1, -1],
+                linear_vars=[block.p_max[t], block.supply_power[t]]
+            ) >= 0
 
         self.block.copy_value_constraint = po.Constraint(self.timesteps, rule=copy_value_rule)
 
         def peak_value_rule(block: po.Block, t: int):
             """Ensure peak value is non-decreasing over timesteps"""
             if t > 0:
-                return block.p_max[t] >= block.p_max[t - 1]
+                return LinearExpression(
+                    constant=0,
+                    linear_coefs=[1, -1],
+                    linear_vars=[block.p_max[t], block.p_max[t - 1]]
+                ) >= 0
             return po.Constraint.Skip
 
         self.block.peak_value_constraint = po.Constraint(self.timesteps, rule=peak_value_rule)
 
         if self.params['full_load_time']:
-            # Ensure the capacity price applies to all timesteps
-            constraint.ForceDuration(
-                model=self.model,
-                params=self.params,
-                flow=self.block.cap_price,
-                duration=len(self.timesteps)
-            )
+            # Supply at full load over the allowed share of all timesteps
+            full_load_coef = self.params['full_load_limit'] / 100 * len(self.timesteps)
 
-            # Ensure the energy price applies to all timesteps
-            constraint.ForceDuration(
-                model=self.model,
-                params=self.params,
-                flow=self.block.en_price,
-                duration=len(self.timesteps)
+            # Check if the full-load time is above the limit (part 1)
+            self.block.first_big_m_constraint = po.Constraint(
+                expr=self.block.total_supply_power - full_load_coef * self.block.p_max[last_step] >= - self.big_M * (1 - self.block.delta)
             )
 
-            def first_big_m_rule(block: po.Block, t: int):
-                """Check if full-load time is above the limit (part 1)"""
-                return block.total_supply_power[t] - (self.params['full_load_limit'] / 100 * len(self.timesteps)) * block.p_max[t] >= - self.big_M * (1 - block.delta[t])
-
-            self.block.first_big_m_constraint = po.Constraint(self.timesteps, rule=first_big_m_rule)
-
-            def second_big_m_rule(block: po.Block, t: int):
-                """Check if full-load time is above the limit (part 2)"""
-                return block.total_supply_power[t] - (self.params['full_load_limit'] / 100 * len(self.timesteps)) * block.p_max[t] <= 0.001 + self.big_M * block.delta[t]
+            # Check if the full-load time is above the limit (part 2)
+            self.block.second_big_m_constraint = po.Constraint(
+                expr=self.block.total_supply_power - full_load_coef * self.block.p_max[last_step] <= 0.001 + self.big_M * self.block.delta
+            )
 
-            self.block.second_big_m_constraint = po.Constraint(self.timesteps, rule=second_big_m_rule)
+            # Big-M value that relaxes the capacity cost of the price level not chosen, the cost of the highest possible peak
+            cost_big_M = max(self.params['net_capacity_price_above'], self.params['net_capacity_price_below']) * self.peak_bound
+
+            # Capacity cost of the peak above the full-load limit, the minimized cost settles on this bound if delta is 1
+            self.block.cost_above_constraint = po.Constraint(expr=LinearExpression(
+                constant=cost_big_M,
+                linear_coefs=[1, -self.params['net_capacity_price_above'], -cost_big_M],
+                linear_vars=[self.block.cost, self.block.p_max[last_step], self.block.delta]
+            ) >= 0)
+
+            # Capacity cost of the peak below the full-load limit, the minimized cost settles on this bound if delta is 0
+            self.block.cost_below_constraint = po.Constraint(expr=LinearExpression(
+                constant=0,
+                linear_coefs=[1, -self.params['net_capacity_price_below'], cost_big_M],
+                linear_vars=[self.block.cost, self.block.p_max[last_step], self.block.delta]
+            ) >= 0)
+
+            # Switch between the two capacity prices
+            self.block.switch_capacity_price_constraint = po.Constraint(
+                expr=self.block.cap_price == self.params['net_capacity_price_above'] * self.block.delta + self.params['net_capacity_price_below'] * (1 - self.block.delta)
+            )
 
-            def compute_cost_rule(block: po.Block, t: int):
-                """Compute the power component of net grid supply costs [€]"""
-                return block.cost[t] == block.p_max[t] * block.cap_price[t]
+            # Switch between the two energy prices
+            self.block.switch_energy_price_constraint = po.Constraint(
+                expr=self.block.en_price == self.params['net_energy_price_above'] * self.block.delta + self.params['net_energy_price_below'] * (1 - self.block.delta)
+            )
 
-            self.block.compute_cost_constraint = po.Constraint(self.timesteps, rule=compute_cost_rule)
 
-            def switch_capacity_price_rule(block: po.Block, t: int):
-                """Switch between the two capacity prices"""
-                return block.cap_price[t] == self.params['net_capacity_price_above'] * block.delta[len(self.timesteps) - 1] + self.params['net_capacity_price_below'] * (1 - block.delta[len(self.timesteps) - 1])
+    def cache_results(self) -> None:
+        """Extract the values of all timesteps at once after the solve"""
 
-            self.block.switch_capacity_price_constraint = po.Constraint(self.timesteps, rule=switch_capacity_price_rule)
+        self.supply_values = helpers.get_values(self.block.supply_power)
+        self.p_max_values = helpers.get_values(self.block.p_max)
 
-            def switch_energy_price_rule(block: po.Block, t: int):
-                """Switch between the two energy prices"""
-                return block.en_price[t] == self.params['net_energy_price_above'] * block.delta[len(self.timesteps) - 1] + self.params['net_energy_price_below'] * (1 - block.delta[len(self.timesteps) - 1])
+        # Total supply until every timestep, the first timestep does not count towards it
+        self.total_supply_values = self.supply_values.cumsum() - self.supply_values[0]
 
-            self.block.switch_energy_price_constraint = po.Constraint(self.timesteps, rule=switch_energy_price_rule)
+        if self.params['full_load_time']:
+            self.cap_price_value = self.block.cap_price.value
+            self.en_price_value = self.block.en_price.value
 
 
-    def get_results(self, t: int, name: str) -> None:
-        """Print out all variables to the terminal"""
-        print(f"\n{f'Current Energy Supply from Grid:':<{self.params['val_pos']}} {po.value(self.block.supply_power[t]) * 0.25:.2f} kWh")
-        print(f"{f'Total Energy Supply from Grid until now:':<{self.params['val_pos']}} {po.value(self.block.total_supply_power[t]) * 0.25:.2f} kWh")
-        print(f"{f'Maximum Power from Grid until now:':<{self.params['val_pos']}} {po.value(self.block.p_max[t]):.2f} kW")
+    def get_results(self, t: int, name: str) -> list[str]:
+        """Return the report lines of all variables"""
+        lines = [
+            f"\n{self.labels['supply']} {self.supply_values[t] * self.step_hours:.2f} kWh",
+            f"{self.labels['total_supply']} {self.total_supply_values[t] * self.step_hours:.2f} kWh",
+            f"{self.labels['p_max']} {self.p_max_values[t]:.2f} kW",
+        ]
         if self.params['full_load_time']:
-            print(f"{f'Net Capacity Price:':<{self.params['val_pos']}} {po.value(self.block.cap_price[t]):.3f} €/kW")
-            print(f"{f'Net Energy Price:':<{self.params['val_pos']}} {po.value(self.block.en_price[t]) * 100:.3f} ct/kWh")
+            lines.append(f"{self.labels['cap_price']} {self.cap_price_value:.3f} €/kW")
+            lines.append(f"{self.labels['en_price']} {self.en_price_value * 100:.3f} ct/kWh")
+        return lines
@@ -1,11 +1,17 @@
+from __future__ import annotations
+
 import pyomo.environ as po
+from pyomo.core.expr.numeric_expr import LinearExpression
 import numpy as np
 
+import helpers
+
 class PV_System():
     def __init__(self, model: po.Model, params: dict):
         self.model = model  # Model of the simulation
         self.params = params  # Parameters of the simulation
         self.timesteps = self.model.timesteps  # Timesteps of the simulation
+        self.labels = {}  # Padded labels of the result lines per name
 
         self._get_inputs()
         self._init_variables()
@@ -16,13 +22,19 @@ class PV_System():
         """Get all relevant inputs"""
 
         # Create a variable with the correct length
-        amount_steps = len(self.timesteps)/self.params['days']
+        amount_steps = 96
         time_steps = np.arange(amount_steps)  # 96 periods for 15-min day simulation
 
         # Mathematics of the profile
         mean_position = (amount_steps - 1) / 2  # peak at 12 PM
-        self.profile = np.exp(-0.5 * ((time_steps - mean_position) / self.params['pv_std_dev']) ** 2)
-        self.profile = np.tile(self.profile, self.params['days'])
+        daily_profile = np.exp(-0.5 * ((time_steps - mean_position) / self.params['pv_std_dev']) ** 2)
+
+        # Adjust the daily profile to match the time resolution before it is repeated for every day
+        daily_profile = helpers.aggregate(daily_profile, self.params['agg_factor'])
+        self.profile = np.broadcast_to(daily_profile, (self.params['days'], len(daily_profile))).ravel()
+
+        # Possible power output in every timestep [kW]
+        self.power = self.profile * self.params['pv_power']
 
 
     def _init_variables(self):
@@ -42,7 +54,7 @@ class PV_System():
         # Nominal power of the PV system [kW]
         self.block.power = po.Param(
             self.timesteps,
-            initialize=self.profile * self.params['pv_power'],
+            initialize=dict(enumerate(self.power.tolist())),
             within=po.NonNegativeReals
         )
 
@@ -56,17 +68,31 @@ class PV_System():
     def _add_constraints(self):
         """Add constraints to define the custom behavior"""
 
+        # Possible power output as plain coefficients
+        power = self.power.tolist()
+
         def activation_rule(block: po.Block, t: int):
             """Decide on whether to activate PV Power"""
-            return block.flow[t] == block.power[t] * block.decision[t]
+            return LinearExpression(
+                constant=0,
+                linear_coefs=[1, -power[t]],
+                linear_vars=[block.flow[t], block.decision[t]]
+            ) == 0
 
         self.block.activation_constraint = po.Constraint(self.timesteps, rule=activation_rule)
 
 
-    def get_results(self, t: int, name: str) -> None:
-        """Print out all variables to the terminal"""
-
-        print(f"\n{f'Flow from {name}:':<{self.params['val_pos']}} {self.block.flow[t].value:.2f} kW")
-        print(f"{f'Possible Flow from {name}:':<{self.params['val_pos']}} {self.block.power[t]:.2f} kW")
-        print(f"{f'{name} Activation choice:':<{self.params['val_pos']}} {self.block.decision[t].value:.0f}")
-
+    def get_results(self, t: int, name: str) -> list[str]:
+        """Return the report lines of all variables"""
+        if name not in self.labels:
+            self.labels[name] = tuple(
+                f"{label:<{self.params['val_pos']}}"
+                for label in (f'Flow from {name}:', f'Possible Flow from {name}:', f'{name} Activation choice:')
+            )
+        flow_label, power_label, decision_label = self.labels[name]
+
+        return [
+            f"\n{flow_label} {self.block.flow[t].value:.2f} kW",
+            f"{power_label} {self.block.power[t]:.2f} kW",
+            f"{decision_label} {self.block.decision[t].value:.0f}",
+        ]
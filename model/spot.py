@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import pyomo.environ as po
 import numpy as np
 
@@ -11,6 +13,7 @@ class Spot:
         self.params = params  # Parameters of the simulation
         self.timesteps = self.model.timesteps  # Timesteps of the simulation
         self.price_file = price_file  # File name of the price profile in the directory
+        self.labels = {}  # Padded labels of the result lines per name
 
         # Counter for naming the blocks uniquely
         Spot.instantiate_counter += 1
@@ -23,15 +26,14 @@ class Spot:
     def _get_inputs(self):
         """Get all relevant inputs"""
 
-        # Get the price profile from a .csv file in the directory
-        self.prices = helpers.get_prices(
+        # Get the price profile from a .csv file in the directory, shared by all markets reading the same file
+        self.prices = helpers.get_spot_prices(
             filename=self.price_file,
-            column_name='Data'
+            column_name='Data',
+            factor=self.params['agg_factor'],
+            steps=len(self.timesteps)
         )
 
-        # Adjust the data to match the simulation duration
-        self.prices = self.prices[:len(self.timesteps)]
-
     def _init_variables(self):
         """Initialize all relevant variables"""
 
@@ -51,15 +53,19 @@ class Spot:
     def _add_constraints(self):
         """Add constraints to define the custom behavior"""
 
-        # Keep the model from being unbounded in the first iteration step
-        self.block.initial_zero_constraint = po.Constraint(
-            expr=self.block.flow[0] == 0
-        )
+        # Keep the model from being unbounded in the first iteration step, fixing the flow needs no constraint row
+        self.block.flow[0].fix(0)
 
 
-    def get_results(self, t: int, name: str) -> None:
-        """Print out all variables to the terminal"""
+    def get_results(self, t: int, name: str) -> list[str]:
+        """Return the report lines of all variables"""
+        if name not in self.labels:
+            self.labels[name] = tuple(
+                f"{label:<{self.params['val_pos']}}" for label in (f'{name}-price:', f'Flow of {name}:')
+            )
+        price_label, flow_label = self.labels[name]
 
-        print(f"\n{f'{name}-price:':<{self.params['val_pos']}} {self.prices[t]:.2f} ct/kWh")
-        print(f"{f'Flow of {name}:':<{self.params['val_pos']}} {self.block.flow[t].value:.2f} kW")
-        print(f"{f'Flow of {name}:':<{self.params['val_pos']}} {self.block.flow[t].value:.2f} kW")
\ No newline at end of file
+        return [
+            f"\n{price_label} {self.prices[t]:.2f} ct/kWh",
+            f"{flow_label} {self.block.flow[t].value:.2f} kW",
+        ]
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+import functools
+import sys
+
+import main
+
+def run_sweep(scenarios: list[str], processes: int | None = None) -> dict[str, float]:
+    """Run several scenarios of the settings in parallel processes"""
+
+    # Every scenario is an independent optimization, so one process solves one scenario at a time
+    processes = min(len(scenarios), processes or mp.cpu_count())
+
+    # Plots would open a browser window per process and the step reports would interleave in the console
+    # Every solver runs single-threaded, so the processes do not compete for the same cores
+    overrides = dict(plot_inputs=False, plot_outputs=False, print_results=False, solver_threads=1)
+
+    with mp.Pool(processes=processes) as pool:
+        objectives = pool.map(functools.partial(main.main, overrides=overrides), scenarios)
+
+    return dict(zip(scenarios, objectives))
+
+if __name__ == "__main__":
+    # Scenarios are given by their column names in the settings, e.g. python sweep.py Ref_Base Ref_Sens
+    results = run_sweep(scenarios=sys.argv[1:] or ['Ref_Sens'])
+
+    # Print the objective function values to the console
+    print(f"\n")
+    for scenario, objective in results.items():
+        print(f"{f'{scenario}:':<20} {objective:.2f} €")
@@ -1,12 +1,15 @@
 import plotly.graph_objects as go
+import plotly.io as pio
+import numpy as np
 import os
 
 class Visualizer:
-    def __init__(self, title: str, x_label: str, y_label: str, target_directory: str) -> None:
+    def __init__(self, title: str, x_label: str, y_label: str, target_directory: str, step_length: int = 15) -> None:
         self.title = title # Title of the plot
         self.x_label = x_label # X-Label of the plot
         self.y_label = y_label # Y-Label of the plot
         self.target_directory = target_directory # Directory to save the plot to
+        self.step_length = step_length # Length of one timestep in minutes
 
         # Shells for future plot data
         self.curve_data = []
@@ -30,17 +33,13 @@ class Visualizer:
     def generate_time_labels(self, timesteps: int) -> list[str]:
         """Generate x-axis labels formatted as 'Day x - HH:MM'"""
 
-        # Initialize
-        labels = []
+        # Compute the parts of all labels at once
+        total_minutes = np.arange(timesteps) * self.step_length
+        days = (total_minutes // (24 * 60) + 1).tolist()
+        hours = (total_minutes % (24 * 60) // 60).tolist()
+        minutes = (total_minutes % 60).tolist()
 
-        # Compute labels
-        for i in range(timesteps):
-            total_minutes = i * 15
-            day = total_minutes // (24 * 60) + 1
-            hour = (total_minutes % (24 * 60)) // 60
-            minute = (total_minutes % 60)
-            labels.append(f'Day {day} - {hour:02}:{minute:02}')
-        return labels
+        return [f'Day {day} - {hour:02}:{minute:02}' for day, hour, minute in zip(days, hours, minutes)]
 
 
     def generate_curve_plot(self, show: bool = True) -> None:
@@ -51,15 +50,18 @@ class Visualizer:
         timesteps = min(len(c) for c in self.curve_data)
         time_labels = self.generate_time_labels(timesteps=timesteps)
 
+        # WebGL traces do not support step lines, so every value is held until the next label
+        step_labels = np.repeat(time_labels, 2)[1:]
+
         # Iterate over the list of curve data and other parameters
         for ind_data, ind_name, ind_color, ind_style in zip(self.curve_data, self.curve_names, self.curve_colors,
                                                             self.curve_styles):
-            fig.add_trace(go.Scatter(
-                x=time_labels[:len(ind_data)],
-                y=ind_data,
+            fig.add_trace(go.Scattergl(
+                x=step_labels,
+                y=np.repeat(np.asarray(ind_data[:timesteps], dtype=float), 2)[:-1],
                 mode='lines',
                 name=ind_name,
-                line=dict(color=ind_color, dash=ind_style, shape='hv')
+                line=dict(color=ind_color, dash=ind_style)
             ))
 
         # Dynamically determine spacing for x-axis ticks
@@ -101,7 +103,9 @@ class Visualizer:
 
         # Save interactive plot as HTML
         os.makedirs(self.target_directory, exist_ok=True)
-        fig.write_html(f"{self.target_directory}/{self.title}.html")
+        # The plotly.js library is loaded from its CDN instead of being embedded into every file
+        with open(f"{self.target_directory}/{self.title}.html", 'w', encoding='utf-8') as file:
+            pio.write_html(fig, file, include_plotlyjs='cdn', validate=False)
 
         # Show the interactive plot
         if show:
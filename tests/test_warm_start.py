@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pyomo.environ as po
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../model'))
+import helpers
+
+# Options stopping every solver at the root node without heuristics, so a solution can only come from the warm start
+ROOT_ONLY_OPTIONS = {
+    'gurobi': {'NodeLimit': 0, 'Heuristics': 0, 'Presolve': 0, 'Cuts': 0},
+    'highs': {'mip_max_nodes': 0, 'mip_heuristic_effort': 0.0, 'presolve': 'off'},
+    'cplex': {'mip.limits.nodes': 0, 'mip.strategy.heuristicfreq': -1, 'preprocessing.presolve': 0},
+}
+
+
+def build_knapsack() -> po.ConcreteModel:
+    """Small knapsack problem whose root relaxation is fractional"""
+    model = po.ConcreteModel()
+    model.x = po.Var(range(6), within=po.Binary)
+    weights = [3, 4, 5, 6, 7, 8]
+    values = [4, 5, 7, 8, 9, 11]
+    model.capacity = po.Constraint(expr=sum(w * model.x[i] for i, w in enumerate(weights)) <= 15)
+    model.objective = po.Objective(expr=sum(v * model.x[i] for i, v in enumerate(values)), sense=po.maximize)
+    return model
+
+
+@pytest.mark.parametrize('name', sorted(helpers.IN_MEMORY_SOLVERS))
+def test_warm_start_is_applied(name, tmp_path):
+    if not po.SolverFactory(helpers.IN_MEMORY_SOLVERS[name]).available(exception_flag=False):
+        pytest.skip(f'{name} is not available')
+
+    # Store a feasible, suboptimal solution as the warm start of an earlier run
+    filename = str(tmp_path / 'warm_start.npz')
+    earlier = build_knapsack()
+    for i in earlier.x:
+        earlier.x[i].set_value(1 if i == 0 else 0)
+    helpers.save_warm_start(model=earlier, filename=filename)
+
+    # Load it into a fresh model of the same structure and solve through the interface used by main
+    model = build_knapsack()
+    solver = helpers.get_solver(name)
+    assert solver.warm_start_capable()
+    assert helpers.load_warm_start(model=model, filename=filename)
+    for option, value in ROOT_ONLY_OPTIONS[name].items():
+        solver.options[option] = value
+    results = solver.solve(model, warmstart=True, load_solutions=False)
+
+    # The only incumbent the solver can report is the warm start
+    assert results.problem.lower_bound == pytest.approx(4)